@@ -0,0 +1,272 @@
+import argparse
+import gzip
+import multiprocessing
+import os
+import re
+import time
+import uuid
+from datetime import datetime, timezone
+from loguru import logger
+from http_client import declared_charset
+from sinks import atomic_write_csv
+
+# 抓取存档 + 离线重解析
+# 爬的时候把原始响应写进压缩WARC(每条记录一个gzip member, 和warcio兼容),
+# 之后修了解析器只要 reparse 一下, 不用再去爬一遍网站
+#
+# 用法:
+#   python scrape/books_aiohttp.py --warc
+#   python scrape/archive.py reparse data/warc/books_aiohttp-*.warc.gz --parser books_pyquery
+#   python scrape/archive.py list data/warc/douban_scrape-*.warc.gz
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+WARC_DIR = os.path.join(DATA_DIR, 'warc')
+BOOK_FIELDS = ['title', 'price', 'stock', 'rating', 'url']
+MOVIE_FIELDS = ['rank', 'title', 'director', 'actors', 'year', 'country',
+                'genre', 'rating', 'votes', 'quote', 'url']
+# aiohttp/requests拿到的body已经解压过了，这几个头原样存会对不上
+SKIP_HEADERS = {'content-encoding', 'transfer-encoding', 'content-length'}
+
+
+def default_warc_path(name):
+    """
+    按脚本名+时间生成存档路径
+    :param name: 脚本名, 如 'books_aiohttp'
+    :return: str
+    """
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    return os.path.join(WARC_DIR, f'{name}-{stamp}.warc.gz')
+
+
+class WarcWriter(object):
+    """最小WARC/1.0写入器，只写response记录"""
+
+    def __init__(self, filepath):
+        os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+        self.filepath = filepath
+        self.count = 0
+        self._f = open(filepath, 'ab')
+
+    def write_response(self, url, status, headers, body, reason='OK'):
+        """
+        写一条response记录
+        :param url: 请求url
+        :param status: http状态码
+        :param headers: 可迭代的 (name, value)
+        :param body: bytes, 原始响应体
+        """
+        lines = [f'HTTP/1.1 {status} {reason}']
+        for name, value in headers:
+            if name.lower() not in SKIP_HEADERS:
+                lines.append(f'{name}: {value}')
+        lines.append(f'Content-Length: {len(body)}')
+        block = ('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8') + body
+
+        warc_headers = [
+            'WARC/1.0',
+            'WARC-Type: response',
+            f'WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>',
+            f'WARC-Date: {datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")}',
+            f'WARC-Target-URI: {url}',
+            'Content-Type: application/http; msgtype=response',
+            f'Content-Length: {len(block)}',
+        ]
+        record = ('\r\n'.join(warc_headers) + '\r\n\r\n').encode('utf-8') + block + b'\r\n\r\n'
+        # 每条记录单独压成一个gzip member，可以随机读取; 文件尾部被截断时 iter_records 只丢最后半条
+        self._f.write(gzip.compress(record, compresslevel=6))
+        self.count += 1
+
+    def close(self):
+        if self._f and not self._f.closed:
+            self._f.close()
+            logger.info(f'archived {self.count} responses -> {self.filepath}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _read_headers(f):
+    """读到空行为止，返回 (首行, {小写name: value})"""
+    first = f.readline()
+    while first in (b'\r\n', b'\n'):
+        first = f.readline()
+    if not first:
+        return None, None
+    headers = {}
+    while True:
+        line = f.readline()
+        if not line or line in (b'\r\n', b'\n'):
+            break
+        name, _, value = line.decode('utf-8', 'replace').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return first.decode('utf-8', 'replace').strip(), headers
+
+
+def iter_records(filepath):
+    """
+    流式读取WARC里的response记录
+    :param filepath: .warc.gz 或 .warc
+    :return: generator of dict(url, status, headers, body)
+    """
+    opener = gzip.open if filepath.endswith('.gz') else open
+    with opener(filepath, 'rb') as f:
+        while True:
+            # 爬虫中途被杀时最后一条记录可能只写了一半, 读到那里就停, 前面完整的照常返回
+            try:
+                version, warc_headers = _read_headers(f)
+                if version is None:
+                    break
+                length = int(warc_headers.get('content-length', 0))
+                block = f.read(length)
+            except (EOFError, gzip.BadGzipFile) as e:
+                logger.warning(f'{filepath}: truncated archive, stop at last complete record ({e})')
+                break
+            if len(block) < length:
+                logger.warning(f'{filepath}: truncated archive, stop at last complete record')
+                break
+            if warc_headers.get('warc-type') != 'response':
+                continue
+
+            head, _, body = block.partition(b'\r\n\r\n')
+            status_line, *header_lines = head.decode('utf-8', 'replace').split('\r\n')
+            parts = status_line.split(' ', 2)
+            status = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+            headers = {}
+            for line in header_lines:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            yield {
+                'url': warc_headers.get('warc-target-uri', ''),
+                'status': status,
+                'headers': headers,
+                'body': body,
+            }
+
+
+# ---------- 解析后端 ----------
+# 每个后端: (content, url, encoding) -> list[dict]，复用各个脚本里现成的解析函数
+# content是原始bytes, encoding是响应头声明的charset(可能为None)
+# 在子进程里才import，避免主进程把bs4/pyquery/scrapy全加载一遍
+
+def _parse_douban_bs4(content, url, encoding=None):
+    from bs4 import BeautifulSoup
+    from douban_scrape import parse_item
+    soup = BeautifulSoup(content, 'lxml', from_encoding=encoding)
+    return [parse_item(it) for it in soup.find_all('div', class_='item')]
+
+
+def _parse_books_bs4(content, url, encoding=None):
+    from bs4 import BeautifulSoup
+    from books_requests import parse_book
+    soup = BeautifulSoup(content, 'lxml', from_encoding=encoding)
+    return [parse_book(art) for art in soup.find_all('article', class_='product_pod')]
+
+
+def _parse_books_pyquery(content, url, encoding=None):
+    from books_aiohttp import parse_page
+    return parse_page(content, encoding)
+
+
+def _parse_books_scrapy(content, url, encoding=None):
+    from scrapy.http import HtmlResponse
+    from books_scrapy import BooksSpider
+    response = HtmlResponse(url=url, body=content, encoding=encoding)
+    return list(BooksSpider().parse_page(response))
+
+
+def _parse_books_regex(content, url, encoding=None):
+    from books_selenium import parse_page_regex
+    return parse_page_regex(content, encoding)
+
+
+PARSERS = {
+    'douban_bs4': (_parse_douban_bs4, MOVIE_FIELDS),
+    'books_bs4': (_parse_books_bs4, BOOK_FIELDS),
+    'books_pyquery': (_parse_books_pyquery, BOOK_FIELDS),
+    'books_scrapy': (_parse_books_scrapy, BOOK_FIELDS),
+    'books_regex': (_parse_books_regex, BOOK_FIELDS),
+}
+
+
+def _reparse_one(job):
+    """子进程入口: (parser名, url, body, charset) -> (url, records)"""
+    parser_name, url, body, encoding = job
+    parse, _ = PARSERS[parser_name]
+    return url, parse(body, url, encoding)
+
+
+def page_key(url):
+    """page-3.html / ?start=50 这类url按数字排序，和爬取时的页序一致"""
+    return [int(n) for n in re.findall(r'\d+', url)], url
+
+
+def reparse(paths, parser_name, workers=None):
+    """
+    离线重解析: 流式读存档 -> 进程池解析 -> 按页序合并
+    :param paths: WARC文件列表
+    :param parser_name: PARSERS里的key
+    :param workers: 进程数, 默认cpu数
+    :return: list[dict]
+    """
+    def jobs():
+        for path in paths:
+            for rec in iter_records(path):
+                if rec['status'] == 200:
+                    yield (parser_name, rec['url'], rec['body'],
+                           declared_charset(rec['headers'].get('content-type')))
+
+    pages = []
+    with multiprocessing.Pool(workers or os.cpu_count()) as pool:
+        for url, records in pool.imap_unordered(_reparse_one, jobs(), chunksize=4):
+            pages.append((url, records))
+
+    pages.sort(key=lambda p: page_key(p[0]))
+    results = []
+    for _, records in pages:
+        results.extend(records)
+    if parser_name.startswith('douban'):
+        results.sort(key=lambda x: int(x['rank']) if x['rank'].isdigit() else 999)
+    return results
+
+
+def save_csv(records, filepath, fields):
+    atomic_write_csv(records, filepath, fields)
+    logger.info(f'saved {len(records)} records -> {filepath}')
+
+
+def main():
+    ap = argparse.ArgumentParser(description='WARC存档工具: 离线重解析 / 查看')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+
+    p_re = sub.add_parser('reparse', help='不联网，用存档重新生成csv')
+    p_re.add_argument('warc', nargs='+', help='.warc.gz 文件')
+    p_re.add_argument('--parser', required=True, choices=sorted(PARSERS),
+                      help='解析后端')
+    p_re.add_argument('--out', help='输出csv, 默认 data/reparse_<parser>.csv')
+    p_re.add_argument('--workers', type=int, default=None, help='进程数')
+
+    p_ls = sub.add_parser('list', help='列出存档里的记录')
+    p_ls.add_argument('warc', nargs='+')
+
+    args = ap.parse_args()
+
+    if args.cmd == 'list':
+        for path in args.warc:
+            for rec in iter_records(path):
+                print(f"{rec['status']}  {len(rec['body']):>8}  {rec['url']}")
+        return
+
+    t0 = time.time()
+    records = reparse(args.warc, args.parser, args.workers)
+    elapsed = time.time() - t0
+    logger.info(f'重解析完成: {len(records)} 条, 耗时 {elapsed:.2f}s (无网络)')
+    out = args.out or os.path.join(DATA_DIR, f'reparse_{args.parser}.csv')
+    save_csv(records, out, PARSERS[args.parser][1])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import mimetypes
+import os
+import time
+import uuid
+from urllib.parse import urljoin, urlsplit
+import aiohttp
+import lxml.html
+from loguru import logger
+from archive import iter_records
+from frontier import SITES
+from http_client import declared_charset, make_session, new_event_loop
+from sinks import atomic_write_bytes
+
+# 封面 / 海报下载
+# 从列表页里抠图片url(books: div.image_container img, 豆瓣: div.pic img), 并发下载,
+# 按内容的sha256存, 同一张图不管从几个url来、扩展名/Content-Type是什么都只存一份:
+#   data/assets/ab/abcdef...        (文件名只有hash, 扩展名记在index.json里)
+# 下载是边收边写边算hash, 不把整张图读进内存; 有自己的并发数和 带宽/请求数 预算,
+# 不和页面抓取抢; 重爬时带上ETag / Last-Modified, 304就跳过
+#
+# 用法:
+#   python scrape/assets.py fetch --site books                       # 现抓列表页再下图
+#   python scrape/assets.py fetch --warc data/warc/books_aiohttp-*.warc.gz
+#   python scrape/books_aiohttp.py --assets                           # 爬完顺手下图
+#   python scrape/assets.py stats
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+ASSET_DIR = os.path.join(DATA_DIR, 'assets')
+INDEX_FILE = os.path.join(ASSET_DIR, 'index.json')
+IMG_XPATH = ('//div[contains(concat(" ", normalize-space(@class), " "), " image_container ")]//img/@src'
+             ' | //div[contains(concat(" ", normalize-space(@class), " "), " pic ")]//img/@src')
+CONCURRENCY = 4
+BANDWIDTH = 2 * 1024 * 1024     # 字节/秒
+RATE = 10.0                     # 请求/秒
+CHUNK = 64 * 1024
+
+
+def extract_image_urls(content, page_url, encoding=None):
+    """
+    :param content: 列表页原始bytes
+    :param page_url: 页面url, 用来补全相对路径
+    :param encoding: 响应头声明的charset
+    :return: list[str] 去重后的绝对url, 保持页面顺序
+    """
+    parser = lxml.html.HTMLParser(encoding=encoding) if encoding else None
+    try:
+        doc = lxml.html.fromstring(content, parser=parser)
+    except (ValueError, lxml.etree.ParserError):
+        return []
+    seen = {}
+    for src in doc.xpath(IMG_XPATH):
+        seen.setdefault(urljoin(page_url, src.strip()), None)
+    return list(seen)
+
+
+class RateBudget(object):
+    """
+    带宽 + 请求数的节流, 按"下一次可用时间"排队, 所有下载协程共享
+    :param bytes_per_sec: None表示不限
+    :param requests_per_sec: None表示不限
+    """
+
+    def __init__(self, bytes_per_sec=BANDWIDTH, requests_per_sec=RATE):
+        self.bytes_per_sec = bytes_per_sec
+        self.requests_per_sec = requests_per_sec
+        self._next = {'bytes': 0.0, 'requests': 0.0}
+
+    async def _take(self, kind, amount, rate):
+        if not rate:
+            return
+        now = time.monotonic()
+        start = max(now, self._next[kind])
+        self._next[kind] = start + amount / rate
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def request(self):
+        await self._take('requests', 1, self.requests_per_sec)
+
+    async def consume(self, n):
+        await self._take('bytes', n, self.bytes_per_sec)
+
+
+def load_index(filepath=INDEX_FILE):
+    """url -> {sha256, path, ext, etag, last_modified, bytes, fetched}"""
+    if not os.path.exists(filepath):
+        return {}
+    with open(filepath, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_index(index, filepath=INDEX_FILE):
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    atomic_write_bytes(filepath, json.dumps(index, ensure_ascii=False, indent=1).encode('utf-8'))
+
+
+def _extension(url, content_type):
+    ext = os.path.splitext(urlsplit(url).path)[1].lower()
+    if ext and len(ext) <= 5:
+        return ext
+    return mimetypes.guess_extension((content_type or '').split(';')[0].strip()) or ''
+
+
+async def fetch_asset(session, url, index, sem, budget, referer=None, root=ASSET_DIR):
+    """
+    下载一张图, 命中304直接返回
+    :return: 'new' / 'dup' / 'unchanged'
+    """
+    entry = index.get(url)
+    headers = {'Referer': referer} if referer else {}
+    if entry and os.path.exists(os.path.join(root, entry['path'])):
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    async with sem:
+        await budget.request()
+        async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=60)) as resp:
+            if resp.status == 304:
+                # 没发条件请求却收到304(服务器/代理乱回), 当作没变, 不记索引
+                if entry:
+                    entry['checked'] = time.time()
+                return 'unchanged'
+            resp.raise_for_status()
+
+            tmp_dir = os.path.join(root, '.tmp')
+            os.makedirs(tmp_dir, exist_ok=True)
+            tmp = os.path.join(tmp_dir, uuid.uuid4().hex)
+            digest = hashlib.sha256()
+            size = 0
+            try:
+                with open(tmp, 'wb') as f:
+                    async for chunk in resp.content.iter_chunked(CHUNK):
+                        await budget.consume(len(chunk))
+                        digest.update(chunk)
+                        f.write(chunk)
+                        size += len(chunk)
+                    f.flush()
+                    os.fsync(f.fileno())
+            except BaseException:
+                os.remove(tmp)
+                raise
+
+            sha = digest.hexdigest()
+            rel = f'{sha[:2]}/{sha}'
+            final = os.path.join(root, rel)
+            if os.path.exists(final):
+                os.remove(tmp)
+                status = 'dup'
+            else:
+                os.makedirs(os.path.dirname(final), exist_ok=True)
+                os.replace(tmp, final)
+                status = 'new'
+
+            index[url] = {
+                'sha256': sha,
+                'path': rel,
+                'ext': _extension(url, resp.headers.get('Content-Type')),
+                'bytes': size,
+                'etag': resp.headers.get('ETag'),
+                'last_modified': resp.headers.get('Last-Modified'),
+                'fetched': time.time(),
+                'checked': time.time(),
+            }
+            return status
+
+
+async def download_assets(urls, headers=None, concurrency=CONCURRENCY, bandwidth=BANDWIDTH,
+                          rate=RATE, index_file=INDEX_FILE, session=None, root=ASSET_DIR):
+    """
+    并发下载一批图片
+    :param urls: list[str] 或 list[(url, referer)]
+    :param headers: 新建session时的默认请求头
+    :param session: 传入就复用调用方的session(连接池/DNS缓存共享), 否则自己建一个
+    :param root: 图片存放目录
+    :return: dict 各状态计数 + 本次下载字节数 + 耗时
+    """
+    jobs = [u if isinstance(u, tuple) else (u, None) for u in urls]
+    index = load_index(index_file)
+    sem = asyncio.Semaphore(concurrency)
+    budget = RateBudget(bandwidth, rate)
+    counts = {'new': 0, 'dup': 0, 'unchanged': 0, 'failed': 0, 'bytes': 0}
+    t0 = time.perf_counter()
+
+    async def run(s):
+        results = await asyncio.gather(*[fetch_asset(s, u, index, sem, budget, ref, root) for u, ref in jobs],
+                                       return_exceptions=True)
+        for (url, _), res in zip(jobs, results):
+            if isinstance(res, Exception):
+                logger.error(f'asset {url} failed: {res}')
+                counts['failed'] += 1
+            else:
+                counts[res] += 1
+                if res != 'unchanged':
+                    counts['bytes'] += index[url]['bytes']
+
+    try:
+        if session is not None:
+            await run(session)
+        else:
+            async with make_session(headers, limit_per_host=concurrency) as s:
+                await run(s)
+    finally:
+        save_index(index, index_file)
+
+    counts['elapsed_s'] = round(time.perf_counter() - t0, 3)
+    logger.info(f'assets: {counts}')
+    return counts
+
+
+async def fetch_listing_images(session, pages):
+    """现抓列表页, 抠出图片url"""
+    out = []
+    for url in pages:
+        try:
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=15)) as resp:
+                resp.raise_for_status()
+                body = await resp.read()
+                out.extend((u, url) for u in extract_image_urls(body, url, resp.charset))
+        except Exception as e:
+            logger.error(f'{url} failed: {e}')
+    return out
+
+
+async def fetch_site_assets(site, **kwargs):
+    """列表页和图片走同一个session"""
+    async with make_session(SITES[site][3], limit_per_host=CONCURRENCY) as session:
+        urls = await fetch_listing_images(session, SITES[site][1])
+        logger.info(f'{len(urls)} image urls')
+        return await download_assets(urls, session=session, **kwargs)
+
+
+def site_for_page(url):
+    """按host认出列表页属于哪个站点, 认不出返回None"""
+    host = urlsplit(url).hostname
+    for site, (_, pages, _, _) in SITES.items():
+        if urlsplit(pages[0]).hostname == host:
+            return site
+    return None
+
+
+def images_from_warc(paths):
+    """从WARC存档里的列表页抠图片url, 不用再访问站点"""
+    out = []
+    for path in paths:
+        for rec in iter_records(path):
+            if rec['status'] != 200 or 'html' not in rec['headers'].get('content-type', 'text/html'):
+                continue
+            charset = declared_charset(rec['headers'].get('content-type'))
+            out.extend((u, rec['url']) for u in extract_image_urls(rec['body'], rec['url'], charset))
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description='封面/海报下载, 按内容hash去重存储')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    p_fetch = sub.add_parser('fetch', help='抓图')
+    src = p_fetch.add_mutually_exclusive_group(required=True)
+    src.add_argument('--site', choices=sorted(SITES), help='现抓该站点的列表页')
+    src.add_argument('--warc', nargs='+', help='从WARC存档里取列表页')
+    p_fetch.add_argument('--concurrency', type=int, default=CONCURRENCY)
+    p_fetch.add_argument('--bandwidth', type=float, default=BANDWIDTH, help='字节/秒, 0表示不限')
+    p_fetch.add_argument('--rate', type=float, default=RATE, help='请求/秒, 0表示不限')
+    sub.add_parser('stats', help='查看已下载的图片')
+    args = ap.parse_args()
+
+    if args.cmd == 'stats':
+        index = load_index()
+        blobs = {e['sha256']: e['bytes'] for e in index.values()}
+        print(f'{len(index)} urls -> {len(blobs)} files, {sum(blobs.values()) / 1024:.0f} KB')
+        return
+
+    budget = {'concurrency': args.concurrency, 'bandwidth': args.bandwidth or None,
+              'rate': args.rate or None}
+    loop = new_event_loop()
+    try:
+        if args.site:
+            loop.run_until_complete(fetch_site_assets(args.site, **budget))
+        else:
+            urls = images_from_warc(args.warc)
+            logger.info(f'{len(urls)} image urls')
+            # 存档里可能混着几个站点, 按列表页所属站点分组, 各用各的请求头
+            by_site = {}
+            for url, referer in urls:
+                by_site.setdefault(site_for_page(referer), []).append((url, referer))
+            for site, jobs in by_site.items():
+                headers = SITES[site][3] if site else None
+                loop.run_until_complete(download_assets(jobs, headers, **budget))
+    finally:
+        loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+import aiohttp
+from loguru import logger
+import bench_history
+from http_client import make_session, new_event_loop, prewarm, accept_encoding
+
+# 连接层benchmark: 旧的默认session vs http_client调过参数的session
+# 用aiohttp的TraceConfig统计: 新建连接数、握手耗时、DNS解析/缓存命中、线上字节数
+#
+# 用法:
+#   python scrape/bench_connection.py --site books --rounds 5
+#   python scrape/bench_connection.py --url http://127.0.0.1:8000/page-{}.html
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+OUT_FILE = os.path.join(DATA_DIR, 'bench_connection.json')
+UA = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
+      'AppleWebKit/537.36 (KHTML, like Gecko) '
+      'Chrome/122.0.0.0 Safari/537.36')
+SITE_URLS = {
+    'books': ['https://books.toscrape.com/catalogue/page-{}.html'.format(p) for p in range(1, 11)],
+    'douban': ['https://movie.douban.com/top250?start={}'.format(s) for s in range(0, 250, 25)],
+}
+CONCURRENCY = 5
+
+
+class Stats(object):
+    """一次运行里的连接指标"""
+
+    def __init__(self):
+        self.connections = 0
+        self.connect_time = 0.0
+        self.dns_resolves = 0
+        self.dns_hits = 0
+        self.wire_bytes = 0
+        self.requests = 0
+
+    def trace_config(self):
+        tc = aiohttp.TraceConfig()
+
+        async def conn_start(session, ctx, params):
+            ctx.conn_t0 = time.perf_counter()
+
+        async def conn_end(session, ctx, params):
+            self.connections += 1
+            self.connect_time += time.perf_counter() - ctx.conn_t0
+
+        async def dns_end(session, ctx, params):
+            self.dns_resolves += 1
+
+        async def dns_hit(session, ctx, params):
+            self.dns_hits += 1
+
+        tc.on_connection_create_start.append(conn_start)
+        tc.on_connection_create_end.append(conn_end)
+        tc.on_dns_resolvehost_end.append(dns_end)
+        tc.on_dns_cache_hit.append(dns_hit)
+        return tc
+
+
+async def crawl(session, urls, stats):
+    """按脚本里的方式并发抓一遍, body不解压, 直接统计线上字节"""
+    sem = asyncio.Semaphore(CONCURRENCY)
+
+    async def one(url):
+        async with sem:
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=15)) as resp:
+                body = await resp.read()
+                stats.wire_bytes += len(body)
+                stats.requests += 1
+
+    await asyncio.gather(*[one(u) for u in urls], return_exceptions=True)
+
+
+async def run_config(name, urls, rounds):
+    """
+    :param name: default / tuned / tuned-identity
+    :return: dict
+    """
+    stats = Stats()
+    headers = {'User-Agent': UA}
+    first_batch = []
+    round_times = []
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        t_round = time.perf_counter()
+        # 每轮相当于脚本跑一次, 重新建session
+        if name == 'default':
+            session = aiohttp.ClientSession(headers=headers, auto_decompress=False,
+                                            trace_configs=[stats.trace_config()])
+        else:
+            if name == 'tuned-identity':
+                headers = dict(headers, **{'Accept-Encoding': 'identity'})
+            session = make_session(headers, limit_per_host=CONCURRENCY, auto_decompress=False,
+                                   trace_configs=[stats.trace_config()])
+        async with session:
+            if name != 'default':
+                await prewarm(session, urls, CONCURRENCY)
+            t_batch = time.perf_counter()
+            await crawl(session, urls[:CONCURRENCY], stats)
+            first_batch.append(time.perf_counter() - t_batch)
+            await crawl(session, urls[CONCURRENCY:], stats)
+        round_times.append(time.perf_counter() - t_round)
+    elapsed = time.perf_counter() - t0
+
+    return {
+        'config': name,
+        'rounds': rounds,
+        'requests': stats.requests,
+        'connections': stats.connections,
+        'handshake_ms_total': round(stats.connect_time * 1000, 1),
+        'dns_resolves': stats.dns_resolves,
+        'dns_cache_hits': stats.dns_hits,
+        'wire_bytes': stats.wire_bytes,
+        'first_batch_s': round(sum(first_batch) / len(first_batch), 3),
+        'elapsed_s': round(elapsed, 3),
+        'round_times_s': round_times,
+    }
+
+
+def print_table(rows):
+    cols = ['config', 'requests', 'connections', 'handshake_ms_total', 'dns_resolves',
+            'dns_cache_hits', 'wire_bytes', 'first_batch_s', 'elapsed_s']
+    print(' | '.join(cols))
+    print(' | '.join('---' for _ in cols))
+    for r in rows:
+        print(' | '.join(str(r[c]) for c in cols))
+
+
+def main():
+    ap = argparse.ArgumentParser(description='连接层benchmark: 握手开销 / 线上字节数')
+    ap.add_argument('--site', choices=sorted(SITE_URLS), default='books')
+    ap.add_argument('--url', help='自定义url模板, {} 替换成1..10')
+    ap.add_argument('--rounds', type=int, default=5,
+                    help='模拟脚本运行次数, 回归检测每项至少要4个样本')
+    ap.add_argument('--out', default=OUT_FILE)
+    ap.add_argument('--no-history', action='store_true', help='不写入 bench_history 历史库')
+    args = ap.parse_args()
+
+    urls = [args.url.format(i) for i in range(1, 11)] if args.url else SITE_URLS[args.site]
+    logger.info(f'Accept-Encoding: {accept_encoding()}, {len(urls)} urls x {args.rounds} rounds')
+
+    loop = new_event_loop()
+    rows = []
+    try:
+        for name in ['default', 'tuned', 'tuned-identity']:
+            rows.append(loop.run_until_complete(run_config(name, urls, args.rounds)))
+            logger.info(f'{name} done')
+    finally:
+        loop.close()
+
+    print_table(rows)
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump({'urls': urls, 'results': rows}, f, indent=2)
+    logger.info(f'saved -> {args.out}')
+
+    if not args.no_history:
+        for r in rows:
+            extra = {k: v for k, v in r.items() if k not in ('config', 'round_times_s')}
+            bench_history.record('connection', r['config'], r['round_times_s'], backend='aiohttp',
+                                 concurrency=CONCURRENCY, dataset_size=len(urls), extra=extra)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,440 @@
+import argparse
+import json
+import math
+import os
+import platform
+import re
+import sqlite3
+import statistics
+import subprocess
+import time
+from loguru import logger
+
+# benchmark历史库
+# 每次爬取/benchmark的耗时都追加进本地SQLite, 带上引擎、并发、数据量、git commit、机器信息
+#   compare: 当前commit和基线commit逐项做Mann-Whitney U检验, 显著变慢的标出来
+#   report:  用库里的真实数据重新生成 report.md 里的耗时表和正文里标了标记的数字, 不再手抄
+#
+# 用法:
+#   python scrape/bench_history.py list
+#   python scrape/bench_history.py compare --baseline 46acd61
+#   python scrape/bench_history.py report
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DATA_DIR = os.path.join(ROOT_DIR, 'data')
+DB_FILE = os.path.join(DATA_DIR, 'bench_history.sqlite')
+REPORT_FILE = os.path.join(ROOT_DIR, 'report.md')
+ALPHA = 0.05
+THRESHOLD = 0.05    # 中位数至少慢5%才算回归, 过滤掉统计显著但没意义的抖动
+MIN_SAMPLES = 4     # 4 vs 4 精确检验最小双侧p约0.029, 3 vs 3 最小只有0.1, 永远判不出回归
+EXACT_MAX = 30      # 两边样本都不超过这个数且没有结时用精确分布
+KEY_COLS = ['kind', 'engine', 'backend', 'concurrency', 'dataset_size', 'variant']
+
+
+def connect(filepath=DB_FILE):
+    os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+    conn = sqlite3.connect(filepath, timeout=10)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts REAL NOT NULL,
+            kind TEXT NOT NULL,
+            engine TEXT NOT NULL,
+            backend TEXT,
+            concurrency INTEGER,
+            dataset_size INTEGER,
+            variant TEXT,
+            git_commit TEXT,
+            git_dirty INTEGER,
+            host TEXT,
+            n INTEGER,
+            median REAL,
+            mean REAL,
+            p90 REAL,
+            p99 REAL,
+            min REAL,
+            max REAL,
+            samples TEXT,
+            extra TEXT
+        )
+    ''')
+    return conn
+
+
+def git_info():
+    """:return: (短commit, 是否有未提交改动), 不在git仓库里就是 (None, None)"""
+    try:
+        head = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=ROOT_DIR, timeout=5).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                capture_output=True, text=True, cwd=ROOT_DIR, timeout=5).stdout
+        return head or None, bool(status.strip()) if head else None
+    except Exception:
+        return None, None
+
+
+def host_info():
+    return {
+        'node': platform.node(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+    }
+
+
+def percentile(samples, q):
+    """线性插值分位数, q取0~100"""
+    s = sorted(samples)
+    if len(s) == 1:
+        return s[0]
+    pos = (len(s) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (pos - lo)
+
+
+def record(kind, engine, samples, backend=None, concurrency=None, dataset_size=None,
+           variant=None, extra=None, db=DB_FILE):
+    """
+    追加一条结果, 写失败只记日志, 不影响爬虫本身
+    :param kind: crawl / parser / connection
+    :param engine: 脚本或解析器名
+    :param samples: 耗时样本(秒), 越小越好
+    :return: 新记录id 或 None
+    """
+    if not samples:
+        return None
+    try:
+        commit, dirty = git_info()
+        conn = connect(db)
+        with conn:
+            cur = conn.execute(
+                'INSERT INTO runs (ts, kind, engine, backend, concurrency, dataset_size, variant, '
+                'git_commit, git_dirty, host, n, median, mean, p90, p99, min, max, samples, extra) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (time.time(), kind, engine, backend, concurrency, dataset_size, variant,
+                 commit, dirty, json.dumps(host_info()), len(samples),
+                 statistics.median(samples), statistics.fmean(samples),
+                 percentile(samples, 90), percentile(samples, 99), min(samples), max(samples),
+                 json.dumps(samples), json.dumps(extra or {}, ensure_ascii=False)))
+        conn.close()
+        return cur.lastrowid
+    except Exception as e:
+        logger.warning(f'bench history写入失败: {e}')
+        return None
+
+
+# ---------- 统计检验 ----------
+
+def _u_distribution(n1, n2):
+    """
+    无结时U统计量的精确分布
+    :return: list, 下标u -> 取到U=u的排列数
+    """
+    # counts[j][u]: 第一组i个、第二组j个时的排列数, 按 f(i,j,u) = f(i-1,j,u-j) + f(i,j-1,u) 逐行递推
+    counts = [[1] for _ in range(n2 + 1)]
+    for i in range(1, n1 + 1):
+        row = [[1]]
+        for j in range(1, n2 + 1):
+            size = i * j + 1
+            cur = [0] * size
+            for u, c in enumerate(counts[j]):
+                if u + j < size:
+                    cur[u + j] += c
+            for u, c in enumerate(row[j - 1]):
+                cur[u] += c
+            row.append(cur)
+        counts = row
+    return counts[n2]
+
+
+def mann_whitney_u(a, b):
+    """
+    双侧Mann-Whitney U检验, 不依赖scipy
+    样本少且没有结时用精确分布, 否则正态近似 + 结(ties)修正
+    :return: (U, p)
+    """
+    n1, n2 = len(a), len(b)
+    ranked = sorted([(v, 0) for v in a] + [(v, 1) for v in b])
+    ranks = [0.0] * len(ranked)
+    tie_term = 0.0
+    i = 0
+    while i < len(ranked):
+        j = i
+        while j + 1 < len(ranked) and ranked[j + 1][0] == ranked[i][0]:
+            j += 1
+        avg = (i + j) / 2 + 1
+        for k in range(i, j + 1):
+            ranks[k] = avg
+        t = j - i + 1
+        tie_term += t ** 3 - t
+        i = j + 1
+
+    r1 = sum(r for r, (_, g) in zip(ranks, ranked) if g == 0)
+    u1 = r1 - n1 * (n1 + 1) / 2
+    if tie_term == 0 and n1 <= EXACT_MAX and n2 <= EXACT_MAX:
+        dist = _u_distribution(n1, n2)
+        total = sum(dist)
+        u = int(u1)
+        lower = sum(dist[:u + 1]) / total
+        upper = sum(dist[u:]) / total
+        return u1, min(1.0, 2 * min(lower, upper))
+    n = n1 + n2
+    mu = n1 * n2 / 2
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1))))
+    if sigma == 0:
+        return u1, 1.0
+    z = (abs(u1 - mu) - 0.5) / sigma
+    p = math.erfc(max(z, 0) / math.sqrt(2))
+    return u1, min(1.0, p)
+
+
+def _samples_by_key(conn, commit):
+    rows = conn.execute(
+        f'SELECT {", ".join(KEY_COLS)}, samples FROM runs WHERE git_commit = ?', (commit,))
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(row[:-1]), []).extend(json.loads(row[-1]))
+    return groups
+
+
+def latest_commit(conn):
+    row = conn.execute('SELECT git_commit FROM runs WHERE git_commit IS NOT NULL '
+                       'ORDER BY ts DESC LIMIT 1').fetchone()
+    return row[0] if row else None
+
+
+def resolve_commit(conn, rev):
+    """
+    把用户给的commit(完整sha / 任意长度前缀 / 分支名 / HEAD~1)对应到库里记的短sha
+    先交给git解析成完整sha, 不在仓库里就按原样; 再和库里的commit互为前缀匹配
+    (短sha的长度会随仓库变大而变长, 不能要求字符串完全相等)
+    :return: 库里的commit
+    :raises ValueError: 没有匹配或匹配到多个
+    """
+    try:
+        full = subprocess.run(['git', 'rev-parse', '--verify', '--quiet', f'{rev}^{{commit}}'],
+                              capture_output=True, text=True, cwd=ROOT_DIR, timeout=5).stdout.strip()
+    except Exception:
+        full = ''
+    full = full or rev
+    commits = [c for (c,) in conn.execute('SELECT DISTINCT git_commit FROM runs WHERE git_commit IS NOT NULL')]
+    matches = sorted(c for c in commits if full.startswith(c) or c.startswith(full))
+    if not matches:
+        raise ValueError(f'没有commit {rev} 的benchmark记录')
+    if len(matches) > 1:
+        raise ValueError(f'commit {rev} 有歧义: {", ".join(matches)}')
+    return matches[0]
+
+
+def compare(conn, baseline, candidate=None, alpha=ALPHA, threshold=THRESHOLD):
+    """
+    逐项对比两个commit
+    :return: list[dict], status为 regression / improvement / same / insufficient
+    :raises ValueError: commit在库里找不到
+    """
+    baseline = resolve_commit(conn, baseline)
+    candidate = resolve_commit(conn, candidate) if candidate else latest_commit(conn)
+    base = _samples_by_key(conn, baseline)
+    cand = _samples_by_key(conn, candidate)
+    rows = []
+    for key in sorted(set(base) & set(cand), key=lambda k: [str(x) for x in k]):
+        a, b = base[key], cand[key]
+        ma, mb = statistics.median(a), statistics.median(b)
+        change = (mb - ma) / ma if ma else 0.0
+        if len(a) < MIN_SAMPLES or len(b) < MIN_SAMPLES:
+            p, status = None, 'insufficient'
+        else:
+            _, p = mann_whitney_u(a, b)
+            if p < alpha and change > threshold:
+                status = 'regression'
+            elif p < alpha and change < -threshold:
+                status = 'improvement'
+            else:
+                status = 'same'
+        rows.append(dict(zip(KEY_COLS, key), baseline=ma, candidate=mb, change=change,
+                         p=p, n_base=len(a), n_cand=len(b), status=status))
+    return rows
+
+
+# ---------- report.md ----------
+
+def _fmt_s(v):
+    return f'{v:.2f}s' if v >= 0.1 else f'{v * 1000:.1f}ms'
+
+
+def latest_crawls(conn):
+    """每个爬虫脚本取最近一个commit的所有运行: engine -> {commit, conc, size, ts, samples}"""
+    rows = conn.execute('''
+        SELECT engine, concurrency, dataset_size, git_commit, ts, samples FROM runs
+        WHERE kind = 'crawl' ORDER BY ts
+    ''').fetchall()
+    latest = {}
+    for engine, conc, size, commit, ts, samples in rows:
+        entry = latest.get(engine)
+        if entry is None or entry['commit'] != commit:
+            entry = latest[engine] = {'commit': commit, 'conc': conc, 'size': size, 'samples': []}
+        entry['samples'].extend(json.loads(samples))
+        entry['size'] = size
+        entry['ts'] = ts
+    return latest
+
+
+def crawl_table(conn):
+    """爬取耗时总表"""
+    latest = latest_crawls(conn)
+    if not latest:
+        return '暂无爬取记录，运行任一爬虫脚本后执行 `python scrape/bench_history.py report`。'
+    lines = ['| 脚本 | 并发 | 条数 | 中位耗时 | p90 | 运行次数 | commit |',
+             '| --- | --- | --- | --- | --- | --- | --- |']
+    for engine, e in sorted(latest.items()):
+        s = e['samples']
+        lines.append(f"| `{engine}` | {e['conc'] or '-'} | {e['size'] or '-'} | "
+                     f"{_fmt_s(statistics.median(s))} | {_fmt_s(percentile(s, 90))} | "
+                     f"{len(s)} | `{e['commit'] or '-'}` |")
+
+    serial = latest.get('douban_scrape')
+    fast = latest.get('douban_scrape_optimized')
+    if serial and fast:
+        ms, mf = statistics.median(serial['samples']), statistics.median(fast['samples'])
+        if mf > 0:
+            lines.append('')
+            lines.append(f'豆瓣加速比（中位数）：**{ms / mf:.1f}x**（{_fmt_s(ms)} / {_fmt_s(mf)}）')
+    return '\n'.join(lines)
+
+
+def parser_table(conn):
+    """解析器benchmark, 只取最近一个commit、full变体"""
+    commit = conn.execute("SELECT git_commit FROM runs WHERE kind = 'parser' "
+                          "ORDER BY ts DESC LIMIT 1").fetchone()
+    if not commit:
+        return '暂无解析器 benchmark 记录，运行 `python scrape/bench_parsers.py` 后执行 report。'
+    rows = conn.execute('''
+        SELECT engine, backend, dataset_size, median FROM runs
+        WHERE kind = 'parser' AND git_commit IS ? AND variant = 'full'
+        ORDER BY engine, dataset_size, ts
+    ''', (commit[0],)).fetchall()
+    latest = {}
+    for engine, backend, size, median in rows:
+        latest[(engine, backend, size)] = median
+    lines = [f'commit `{commit[0]}`', '',
+             '| 解析器 | 后端 | 条数 | 中位耗时 | items/s |',
+             '| --- | --- | --- | --- | --- |']
+    for (engine, backend, size), median in sorted(latest.items()):
+        lines.append(f'| `{engine}` | {backend or "-"} | {size} | {_fmt_s(median)} | '
+                     f'{size / median:,.0f} |')
+    return '\n'.join(lines)
+
+
+def crawl_figure(latest, engines):
+    """
+    正文里的单个耗时数字
+    :param engines: 逗号分隔的脚本名, 取其中最近运行的那个(books_selenium按档位会记成books_regex等)
+    :return: str, 没有记录时返回None(保留原文)
+    """
+    found = [latest[e] for e in engines.split(',') if e in latest]
+    if not found:
+        return None
+    e = max(found, key=lambda x: x['ts'])
+    return f"**{_fmt_s(statistics.median(e['samples']))}**（中位数，{len(e['samples'])} 次，`{e['commit'] or '-'}`）"
+
+
+def speedup_figure(latest, pair):
+    """:param pair: '串行脚本/并发脚本'"""
+    slow, fast = pair.split('/')
+    if slow not in latest or fast not in latest:
+        return None
+    ms, mf = statistics.median(latest[slow]['samples']), statistics.median(latest[fast]['samples'])
+    if mf <= 0:
+        return None
+    return f'**{ms / mf:.1f}x（{_fmt_s(ms)} / {_fmt_s(mf)}）**'
+
+
+INLINE_RE = re.compile(r'<!-- bench:(crawl|speedup):([\w,/]+):start -->(.*?)<!-- bench:\1:\2:end -->')
+
+
+def render_report(conn, filepath=REPORT_FILE):
+    """
+    替换 report.md 里的标记:
+      <!-- bench:NAME:start --> ... <!-- bench:NAME:end -->         整张表(crawl / parsers)
+      <!-- bench:crawl:脚本[,脚本]:start -->...<!-- ...:end -->     正文里的单个耗时
+      <!-- bench:speedup:串行/并发:start -->...<!-- ...:end -->      正文里的加速比
+    正文数字没有对应记录时保留原文
+    """
+    with open(filepath, encoding='utf-8-sig') as f:
+        text = f.read()
+    tables = {'crawl': crawl_table(conn), 'parsers': parser_table(conn)}
+    for name, body in tables.items():
+        pattern = re.compile(rf'(<!-- bench:{name}:start -->\n).*?(<!-- bench:{name}:end -->)', re.DOTALL)
+        text = pattern.sub(lambda m: m.group(1) + body + '\n' + m.group(2), text)
+
+    latest = latest_crawls(conn)
+
+    def inline(m):
+        kind, arg, old = m.groups()
+        value = crawl_figure(latest, arg) if kind == 'crawl' else speedup_figure(latest, arg)
+        start, end = f'<!-- bench:{kind}:{arg}:start -->', f'<!-- bench:{kind}:{arg}:end -->'
+        return start + (value if value is not None else old) + end
+    text = INLINE_RE.sub(inline, text)
+    tmp = filepath + '.tmp'
+    with open(tmp, 'w', encoding='utf-8-sig') as f:
+        f.write(text)
+    os.replace(tmp, filepath)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='benchmark历史库: 查看 / 回归检测 / 生成报告表格')
+    ap.add_argument('--db', default=DB_FILE)
+    sub = ap.add_subparsers(dest='cmd', required=True)
+
+    p_ls = sub.add_parser('list', help='最近的记录')
+    p_ls.add_argument('--limit', type=int, default=20)
+
+    p_cmp = sub.add_parser('compare', help='和基线commit对比, 有显著回归时退出码为1, 没有可比的项时为2')
+    p_cmp.add_argument('--baseline', required=True, help='基线git commit, 完整sha/前缀/分支名都行')
+    p_cmp.add_argument('--candidate', help='默认最近一次记录的commit')
+    p_cmp.add_argument('--alpha', type=float, default=ALPHA)
+    p_cmp.add_argument('--threshold', type=float, default=THRESHOLD, help='最小相对变化')
+
+    p_rep = sub.add_parser('report', help='重新生成 report.md 里的耗时表')
+    p_rep.add_argument('--report', default=REPORT_FILE)
+
+    args = ap.parse_args()
+    conn = connect(args.db)
+
+    if args.cmd == 'list':
+        rows = conn.execute('SELECT ts, kind, engine, backend, concurrency, dataset_size, variant, '
+                            'git_commit, n, median, p90 FROM runs ORDER BY ts DESC LIMIT ?',
+                            (args.limit,))
+        for ts, kind, engine, backend, conc, size, variant, commit, n, median, p90 in rows:
+            print(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(ts))}  {commit or '-':8s} "
+                  f"{kind:10s} {engine:36s} {backend or '-':8s} c={conc or '-'} size={size or '-'} "
+                  f"{variant or '':8s} n={n} median={_fmt_s(median)} p90={_fmt_s(p90)}")
+    elif args.cmd == 'compare':
+        try:
+            rows = compare(conn, args.baseline, args.candidate, args.alpha, args.threshold)
+        except ValueError as e:
+            logger.error(e)
+            raise SystemExit(2)
+        if not rows:
+            # 没东西可比不能当成通过, 不然回归检测会悄悄放行
+            logger.error('两个commit没有共同的benchmark项')
+            raise SystemExit(2)
+        for r in rows:
+            p = f"{r['p']:.3f}" if r['p'] is not None else '-'
+            print(f"{r['status']:12s} {r['kind']:10s} {r['engine']:36s} size={r['dataset_size'] or '-'} "
+                  f"{r['variant'] or '':8s} {_fmt_s(r['baseline'])} -> {_fmt_s(r['candidate'])} "
+                  f"({r['change']:+.1%}) p={p} n={r['n_base']}/{r['n_cand']}")
+        regressions = [r for r in rows if r['status'] == 'regression']
+        if regressions:
+            logger.error(f'{len(regressions)} 项显著回归')
+            raise SystemExit(1)
+    elif args.cmd == 'report':
+        render_report(conn, args.report)
+        logger.info(f'updated -> {args.report}')
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
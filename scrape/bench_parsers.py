@@ -0,0 +1,289 @@
+import argparse
+import html
+import json
+import os
+import platform
+import statistics
+import time
+import tracemalloc
+from loguru import logger
+import bench_history
+
+# 解析器micro-benchmark, 不联网
+# 按真实页面结构生成任意条数的合成页面(可带缺字段的条目), 单独给每个解析器计时:
+#   items/s, 每条记录的内存分配, 以及输出和生成时的预期结果是否一致
+# 结果写成json, 换了解析器代码后可以跨commit对比
+#
+# 用法:
+#   python scrape/bench_parsers.py
+#   python scrape/bench_parsers.py --sizes 25,1000,10000 --variants full,missing --repeat 7
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+OUT_FILE = os.path.join(DATA_DIR, 'bench_parsers.json')
+SIZES = [25, 250, 2500, 10000]
+VARIANTS = ['full', 'missing']
+REPEAT = 5
+RATING_WORDS = ['One', 'Two', 'Three', 'Four', 'Five']
+DETAIL_BASE = 'https://books.toscrape.com/catalogue/'
+
+
+def _missing(variant, i, every):
+    """missing变体里每隔every条去掉一个字段"""
+    return variant == 'missing' and i % every == every - 1
+
+
+# ---------- 合成页面 ----------
+
+def make_douban_page(n, variant='full'):
+    """
+    生成n条豆瓣Top250结构的条目
+    :return: (bytes, 预期记录list)
+    """
+    parts = ['<!DOCTYPE html><html lang="zh-CN"><head><meta charset="utf-8"><title>豆瓣电影 Top 250</title>'
+             '</head><body><div id="content"><ol class="grid_view">']
+    expected = []
+    for i in range(n):
+        rank = str(i + 1)
+        url = f'https://movie.douban.com/subject/{1290000 + i}/'
+        title = f'电影{i}号'
+        director = f'导演{i % 97} Director {i % 97}'
+        actors = '' if _missing(variant, i, 13) else f'演员{i % 89} Actor {i % 89}'
+        year = str(1950 + i % 70)
+        country = ['美国', '中国大陆 中国香港', '日本', '法国 意大利'][i % 4]
+        genre = ['剧情', '犯罪 剧情', '爱情 同性', '动画 奇幻'][i % 4]
+        rating = '' if _missing(variant, i, 11) else f'{8 + (i % 20) / 10:.1f}'
+        votes = str(3000000 - i * 37)
+        quote = '' if _missing(variant, i, 7) else f'第{i}句短评。'
+
+        people = f'导演: {director}&nbsp;&nbsp;&nbsp;'
+        if actors:
+            people += f'主演: {actors}'
+        rating_html = f'<span class="rating_num" property="v:average">{rating}</span>' if rating else ''
+        quote_html = f'<p class="quote"><span class="inq">{quote}</span></p>' if quote else ''
+        parts.append(
+            f'<li><div class="item">'
+            f'<div class="pic"><em class="">{rank}</em><a href="{url}">'
+            f'<img width="100" alt="{title}" src="https://img1.doubanio.com/view/photo/s_ratio_poster/public/p{i}.webp"></a></div>'
+            f'<div class="info"><div class="hd"><a href="{url}" class="">'
+            f'<span class="title">{title}</span><span class="title">&nbsp;/&nbsp;Movie {i}</span>'
+            f'<span class="other">&nbsp;/&nbsp;别名{i}</span></a><span class="playable">[可播放]</span></div>'
+            f'<div class="bd"><p class="">{people}<br>\n'
+            f'                            {year}&nbsp;/&nbsp;{country}&nbsp;/&nbsp;{genre}\n                        </p>'
+            f'<div class="star"><span class="rating5-t"></span>{rating_html}'
+            f'<span property="v:best" content="10.0"></span><span>{votes}人评价</span></div>'
+            f'{quote_html}</div></div></div></li>'
+        )
+        expected.append({
+            'rank': rank, 'title': title, 'director': director,
+            'actors': actors, 'year': year, 'country': country,
+            'genre': genre, 'rating': rating, 'votes': votes,
+            'quote': quote, 'url': url
+        })
+    parts.append('</ol></div></body></html>')
+    return ''.join(parts).encode('utf-8'), expected
+
+
+def make_books_page(n, variant='full'):
+    """
+    生成n条books.toscrape列表结构的商品
+    :return: (bytes, 预期记录list)
+    """
+    parts = ['<!DOCTYPE html><html lang="en-us" class="no-js"><head><meta charset="utf-8" />'
+             '<title>All products | Books to Scrape - Sandbox</title></head><body>'
+             '<section><ol class="row">']
+    expected = []
+    for i in range(n):
+        slug = f'book-{i}_{100000 - i}/index.html'
+        title = f"Book {i}: It's & More"
+        star = None if _missing(variant, i, 7) else RATING_WORDS[i % 5]
+        price = None if _missing(variant, i, 11) else f'{10 + i % 50}.{i % 100:02d}'
+
+        star_html = (f'<p class="star-rating {star}"><i class="icon-star"></i><i class="icon-star"></i></p>'
+                     if star else '')
+        price_html = f'<p class="price_color">£{price}</p>' if price else ''
+        parts.append(
+            f'<li class="col-xs-6 col-sm-4 col-md-3 col-lg-3"><article class="product_pod">\n'
+            f'<div class="image_container"><a href="{slug}"><img src="../media/cache/{i % 256:02x}/x{i}.jpg" '
+            f'alt="{html.escape(title)}" class="thumbnail"></a></div>\n'
+            f'{star_html}\n'
+            f'<h3><a href="{slug}" title="{html.escape(title)}">{html.escape(title[:20])}...</a></h3>\n'
+            f'<div class="product_price">\n{price_html}\n'
+            f'<p class="instock availability">\n    <i class="icon-ok"></i>\n    \n        In stock\n    \n</p>\n'
+            f'<form><button type="submit" class="btn btn-primary btn-block">Add to basket</button></form>\n'
+            f'</div></article></li>'
+        )
+        expected.append({
+            'title': title,
+            'price': price or '0',
+            'stock': 'In stock',
+            'rating': RATING_WORDS.index(star) + 1 if star else 0,
+            'url': DETAIL_BASE + slug,
+        })
+    parts.append('</ol></section></body></html>')
+    return ''.join(parts).encode('utf-8'), expected
+
+
+GENERATORS = {'douban': make_douban_page, 'books': make_books_page}
+
+
+# ---------- 被测解析器 ----------
+# 统一成 content(bytes) -> list[dict], 整页解析也算在内(bs4的逐条函数离不开soup)
+
+def _douban(module):
+    def run(content):
+        from bs4 import BeautifulSoup
+        parse_item = __import__(module).parse_item
+        soup = BeautifulSoup(content, 'lxml')
+        return [parse_item(it) for it in soup.find_all('div', class_='item')]
+    return run
+
+
+def _books_requests(content):
+    from bs4 import BeautifulSoup
+    from books_requests import parse_book
+    soup = BeautifulSoup(content, 'lxml')
+    return [parse_book(art) for art in soup.find_all('article', class_='product_pod')]
+
+
+def _books_aiohttp(content):
+    from books_aiohttp import parse_page
+    return parse_page(content)
+
+
+def _books_scrapy(content):
+    from scrapy.http import HtmlResponse
+    from books_scrapy import BooksSpider
+    response = HtmlResponse(url=DETAIL_BASE + 'page-1.html', body=content, encoding='utf-8')
+    return list(BooksSpider().parse_page(response))
+
+
+def _books_regex(content):
+    from books_selenium import parse_page_regex
+    return parse_page_regex(content)
+
+
+# (名字, site, 后端, 函数, 依赖的可选模块)
+EXTRACTORS = [
+    ('douban_scrape.parse_item', 'douban', 'bs4', _douban('douban_scrape'), None),
+    ('douban_scrape_optimized.parse_item', 'douban', 'bs4', _douban('douban_scrape_optimized'), None),
+    ('books_requests.parse_book', 'books', 'bs4', _books_requests, None),
+    ('books_aiohttp.parse_page', 'books', 'pyquery', _books_aiohttp, None),
+    ('BooksSpider.parse_page', 'books', 'scrapy', _books_scrapy, 'scrapy'),
+    ('books_selenium.parse_page_regex', 'books', 'regex', _books_regex, None),
+]
+
+
+def available(module):
+    if module is None:
+        return True
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+
+def bench_one(fn, content, n, repeat):
+    """
+    :return: dict, 计时取中位数; 内存单独跑一次(tracemalloc会拖慢计时)
+    """
+    records = fn(content)  # 预热, 顺便拿结果做比对
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(content)
+        times.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    blocks_before = len(tracemalloc.take_snapshot().traces)
+    tracemalloc.reset_peak()
+    result = fn(content)
+    _, peak = tracemalloc.get_traced_memory()
+    blocks_after = len(tracemalloc.take_snapshot().traces)
+    tracemalloc.stop()
+    del result
+
+    median = statistics.median(times)
+    return {
+        'records': records,
+        'median_s': median,
+        'min_s': min(times),
+        'max_s': max(times),
+        'times_s': times,
+        'items_per_s': n / median if median > 0 else 0.0,
+        'peak_bytes_per_item': peak / n,
+        'retained_blocks_per_item': (blocks_after - blocks_before) / n,
+    }
+
+
+def run_suite(sizes=SIZES, variants=VARIANTS, repeat=REPEAT, only=None):
+    """
+    跑全部组合
+    :param only: 只跑名字里包含这些子串的解析器
+    :return: list[dict]
+    """
+    results = []
+    skipped = set()
+    for site, gen in GENERATORS.items():
+        for variant in variants:
+            for n in sizes:
+                content, expected = gen(n, variant)
+                for name, ex_site, backend, fn, dep in EXTRACTORS:
+                    if ex_site != site or (only and not any(o in name for o in only)):
+                        continue
+                    if not available(dep):
+                        if name not in skipped:
+                            logger.warning(f'{name}: {dep}未安装, 跳过')
+                            skipped.add(name)
+                        continue
+                    r = bench_one(fn, content, n, repeat)
+                    equal = r.pop('records') == expected
+                    results.append(dict(extractor=name, site=site, backend=backend, variant=variant,
+                                        size=n, page_bytes=len(content), equal=equal, **r))
+                    logger.info(f'{name:36s} {variant:7s} n={n:<6d} {r["items_per_s"]:>10.0f} items/s '
+                                f'{r["peak_bytes_per_item"]:>8.0f} B/item  equal={equal}')
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser(description='解析器micro-benchmark(合成页面, 不联网)')
+    ap.add_argument('--sizes', default=','.join(map(str, SIZES)), help='每页条数, 逗号分隔')
+    ap.add_argument('--variants', default=','.join(VARIANTS), help='full / missing')
+    ap.add_argument('--repeat', type=int, default=REPEAT, help='每个组合计时次数, 取中位数')
+    ap.add_argument('--only', action='append', help='只跑名字包含该子串的解析器, 可多次')
+    ap.add_argument('--out', default=OUT_FILE, help='结果json')
+    ap.add_argument('--no-history', action='store_true', help='不写入 bench_history 历史库')
+    args = ap.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    variants = [v for v in args.variants.split(',') if v]
+    results = run_suite(sizes, variants, args.repeat, args.only)
+
+    commit, dirty = bench_history.git_info()
+    meta = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'git_commit': commit,
+        'git_dirty': dirty,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=2, ensure_ascii=False)
+    logger.info(f'saved {len(results)} results -> {args.out}')
+
+    if not args.no_history:
+        for r in results:
+            bench_history.record('parser', r['extractor'], r['times_s'], backend=r['backend'],
+                                 dataset_size=r['size'], variant=r['variant'],
+                                 extra={'peak_bytes_per_item': r['peak_bytes_per_item'],
+                                        'equal': r['equal']})
+
+    bad = [r['extractor'] for r in results if not r['equal']]
+    if bad:
+        logger.warning(f'结果和预期不一致: {sorted(set(bad))}')
+
+
+if __name__ == '__main__':
+    main()
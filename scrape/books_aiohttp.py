@@ -1,10 +1,19 @@
+import argparse
 import asyncio
-import csv
 import os
+import re
 import time
 import aiohttp
+import lxml.html
 from pyquery import PyQuery as pq
 from loguru import logger
+import bench_history
+from archive import BOOK_FIELDS, WarcWriter, default_warc_path
+from assets import download_assets, extract_image_urls
+from http_client import make_session, new_event_loop, prewarm
+from search_index import build_index, csv_dataset
+from sinks import atomic_write_csv, write_partitioned
+from snapshot import snapshot_path, write_snapshot
 
 # Task2 - 方案二
 # aiohttp + pyquery 异步爬取
@@ -18,15 +27,25 @@ HEADERS = {
                   'Chrome/122.0.0.0 Safari/537.36'
 }
 RATING_MAP = {'One': 1, 'Two': 2, 'Three': 3, 'Four': 4, 'Five': 5}
+PRICE_RE = re.compile(r'\d+(?:\.\d+)?')
 MAX_PAGES = 10
 CONCURRENCY = 5
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
 CSV_FILE = os.path.join(DATA_DIR, 'books_aiohttp.csv')
 
 
-def parse_page(html):
-    """pyquery解析页面"""
-    doc = pq(html)
+def parse_page(content, encoding=None):
+    """
+    pyquery解析页面
+    :param content: 原始bytes(也兼容str)
+    :param encoding: 响应头里声明的charset, None时lxml按<meta charset>识别
+    :return: list[dict]
+    """
+    if isinstance(content, bytes):
+        parser = lxml.html.HTMLParser(encoding=encoding) if encoding else None
+        doc = pq(lxml.html.fromstring(content, parser=parser))
+    else:
+        doc = pq(content)
     books = []
     for item in doc('article.product_pod').items():
         a = item.find('h3 a')
@@ -34,8 +53,8 @@ def parse_page(html):
         href = a.attr('href') or ''
         url = DETAIL_BASE + href.lstrip('./')
 
-        price_text = item.find('p.price_color').text()
-        price = price_text.lstrip('£Â') if price_text else '0'
+        m = PRICE_RE.search(item.find('p.price_color').text() or '')
+        price = m.group() if m else '0'
 
         stock = item.find('p.instock').text().strip()
 
@@ -57,54 +76,90 @@ def parse_page(html):
     return books
 
 
-async def fetch(session, url, sem):
-    """fetch单页"""
+async def fetch(session, url, sem, archive=None):
+    """
+    fetch单页, 返回原始bytes和声明的charset, 传了archive就顺手把原始响应存进WARC
+    :return: (bytes, charset or None)
+    """
     async with sem:
         async with session.get(url, timeout=aiohttp.ClientTimeout(total=10)) as resp:
             resp.raise_for_status()
-            return await resp.text()
-
-
-async def scrape_all(max_pages):
-    """aiohttp并发爬全部页"""
+            body = await resp.read()
+            if archive is not None:
+                archive.write_response(url, resp.status, resp.headers.items(), body, resp.reason)
+            return body, resp.charset
+
+
+async def scrape_all(max_pages, archive=None, assets=False):
+    """
+    aiohttp并发爬全部页
+    :param assets: 爬完在同一个session上下载封面(连接池/DNS缓存复用, 并发和带宽走assets自己的预算)
+    :return: (list[dict], 图片下载统计 or None)
+    """
     sem = asyncio.Semaphore(CONCURRENCY)
     books = []
-    async with aiohttp.ClientSession(headers=HEADERS) as session:
+    images = []
+    async with make_session(HEADERS, limit_per_host=CONCURRENCY) as session:
+        await prewarm(session, [BASE_URL], CONCURRENCY)
         tasks = []
         for page in range(1, max_pages + 1):
             url = BASE_URL.format(page)
-            tasks.append(fetch(session, url, sem))
-        htmls = await asyncio.gather(*tasks, return_exceptions=True)
+            tasks.append(fetch(session, url, sem, archive))
+        pages = await asyncio.gather(*tasks, return_exceptions=True)
 
-    for i, html in enumerate(htmls):
-        if isinstance(html, Exception):
-            logger.error(f'page {i+1} failed: {html}')
-            continue
-        page_books = parse_page(html)
-        books.extend(page_books)
-        logger.info(f'page {i+1}: parsed {len(page_books)} books')
+        for i, page in enumerate(pages):
+            if isinstance(page, Exception):
+                logger.error(f'page {i+1} failed: {page}')
+                continue
+            page_books = parse_page(*page)
+            if assets:
+                page_url = BASE_URL.format(i + 1)
+                images.extend((u, page_url) for u in extract_image_urls(page[0], page_url, page[1]))
+            books.extend(page_books)
+            logger.info(f'page {i+1}: parsed {len(page_books)} books')
 
-    return books
+        asset_stats = await download_assets(images, session=session) if images else None
+
+    return books, asset_stats
 
 
 def save_csv(books, filepath):
-    os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    with open(filepath, 'w', newline='', encoding='utf-8-sig') as f:
-        w = csv.DictWriter(f, fieldnames=['title', 'price', 'stock', 'rating', 'url'])
-        w.writeheader()
-        w.writerows(books)
+    atomic_write_csv(books, filepath, BOOK_FIELDS)
     logger.info(f'saved {len(books)} books -> {filepath}')
 
 
 def main():
+    ap = argparse.ArgumentParser(description='books.toscrape aiohttp+pyquery爬虫')
+    ap.add_argument('--warc', action='store_true',
+                    help='把原始响应存到 data/warc/, 之后可用 archive.py reparse 离线重解析')
+    ap.add_argument('--partitioned', action='store_true',
+                    help='写成按日期/run分区的压缩分块 data/books_aiohttp/, 不再覆盖单个csv')
+    ap.add_argument('--codec', choices=['gzip', 'zstd'], default='gzip', help='分区压缩格式')
+    ap.add_argument('--assets', action='store_true', help='爬完顺手下载封面到 data/assets/')
+    args = ap.parse_args()
+
     logger.info(f'aiohttp+pyquery异步爬取, 共{MAX_PAGES}页')
+    archive = WarcWriter(default_warc_path('books_aiohttp')) if args.warc else None
     t0 = time.time()
-    loop = asyncio.new_event_loop()
-    books = loop.run_until_complete(scrape_all(MAX_PAGES))
-    loop.close()
-    elapsed = time.time() - t0
+    loop = new_event_loop()
+    try:
+        books, asset_stats = loop.run_until_complete(scrape_all(MAX_PAGES, archive, args.assets))
+    finally:
+        loop.close()
+        if archive:
+            archive.close()
+    # 图片不算进爬取耗时, 有自己的带宽预算
+    elapsed = time.time() - t0 - (asset_stats['elapsed_s'] if asset_stats else 0)
     logger.info(f'爬取完成: {len(books)} 本, 耗时 {elapsed:.2f}s')
-    save_csv(books, CSV_FILE)
+    bench_history.record('crawl', 'books_aiohttp', [elapsed], backend='pyquery',
+                         concurrency=CONCURRENCY, dataset_size=len(books))
+    if args.partitioned:
+        write_partitioned(books, 'books_aiohttp', BOOK_FIELDS, codec=args.codec)
+    else:
+        save_csv(books, CSV_FILE)
+        # csv旁边顺手写一份二进制快照(分析时mmap直接打开)和搜索索引
+        write_snapshot(books, snapshot_path(CSV_FILE), BOOK_FIELDS)
+        build_index(books, csv_dataset(CSV_FILE), BOOK_FIELDS)
 
 
 if __name__ == '__main__':
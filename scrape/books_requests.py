@@ -1,9 +1,16 @@
-import csv
+import argparse
 import os
+import re
 import time
 import requests
 from bs4 import BeautifulSoup
 from loguru import logger
+import bench_history
+from archive import BOOK_FIELDS, WarcWriter, default_warc_path
+from http_client import declared_charset
+from search_index import build_index, csv_dataset
+from sinks import atomic_write_csv, write_partitioned
+from snapshot import snapshot_path, write_snapshot
 
 # Task2 - 方案一
 # requests + bs4 同步爬取 books.toscrape.com
@@ -17,6 +24,7 @@ HEADERS = {
                   'Chrome/122.0.0.0 Safari/537.36'
 }
 RATING_MAP = {'One': 1, 'Two': 2, 'Three': 3, 'Four': 4, 'Five': 5}
+PRICE_RE = re.compile(r'\d+(?:\.\d+)?')
 MAX_PAGES = 10
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
 CSV_FILE = os.path.join(DATA_DIR, 'books_requests.csv')
@@ -36,8 +44,9 @@ def parse_book(article):
 
     # 价格
     price_p = article.find('p', class_='price_color')
-    price_text = price_p.get_text(strip=True) if price_p else '£0'
-    price = price_text.lstrip('£Â')
+    price_text = price_p.get_text(strip=True) if price_p else ''
+    m = PRICE_RE.search(price_text)
+    price = m.group() if m else '0'
 
     # 库存
     stock_p = article.find('p', class_='instock')
@@ -62,8 +71,13 @@ def parse_book(article):
     }
 
 
-def scrape_books(max_pages=MAX_PAGES):
-    """同步爬取"""
+def scrape_books(max_pages=MAX_PAGES, archive=None):
+    """
+    同步爬取
+    :param max_pages: 页数
+    :param archive: WarcWriter, 可选, 存原始响应
+    :return: list[dict]
+    """
     sess = requests.Session()
     sess.headers.update(HEADERS)
     result = []
@@ -76,8 +90,12 @@ def scrape_books(max_pages=MAX_PAGES):
         except Exception as e:
             logger.error(f'page {page} request failed: {e}')
             break
+        if archive is not None:
+            archive.write_response(url, resp.status_code, resp.headers.items(), resp.content, resp.reason)
 
-        soup = BeautifulSoup(resp.text, 'lxml')
+        # 直接把bytes和声明的charset交给解析器, 不经过resp.text再解码一遍
+        soup = BeautifulSoup(resp.content, 'lxml',
+                             from_encoding=declared_charset(resp.headers.get('Content-Type')))
         articles = soup.find_all('article', class_='product_pod')
         for art in articles:
             result.append(parse_book(art))
@@ -89,21 +107,38 @@ def scrape_books(max_pages=MAX_PAGES):
 
 
 def save_csv(books, filepath):
-    os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    with open(filepath, 'w', newline='', encoding='utf-8-sig') as f:
-        w = csv.DictWriter(f, fieldnames=['title', 'price', 'stock', 'rating', 'url'])
-        w.writeheader()
-        w.writerows(books)
+    atomic_write_csv(books, filepath, BOOK_FIELDS)
     logger.info(f'saved {len(books)} books -> {filepath}')
 
 
 def main():
+    ap = argparse.ArgumentParser(description='books.toscrape requests+bs4爬虫')
+    ap.add_argument('--warc', action='store_true',
+                    help='把原始响应存到 data/warc/, 之后可用 archive.py reparse 离线重解析')
+    ap.add_argument('--partitioned', action='store_true',
+                    help='写成按日期/run分区的压缩分块 data/books_requests/, 不再覆盖单个csv')
+    ap.add_argument('--codec', choices=['gzip', 'zstd'], default='gzip', help='分区压缩格式')
+    args = ap.parse_args()
+
     logger.info(f'requests同步爬取, 共{MAX_PAGES}页')
+    archive = WarcWriter(default_warc_path('books_requests')) if args.warc else None
     t0 = time.time()
-    books = scrape_books()
+    try:
+        books = scrape_books(archive=archive)
+    finally:
+        if archive:
+            archive.close()
     elapsed = time.time() - t0
     logger.info(f'爬取完成: {len(books)} 本, 耗时 {elapsed:.2f}s')
-    save_csv(books, CSV_FILE)
+    bench_history.record('crawl', 'books_requests', [elapsed], backend='bs4',
+                         concurrency=1, dataset_size=len(books))
+    if args.partitioned:
+        write_partitioned(books, 'books_requests', BOOK_FIELDS, codec=args.codec)
+    else:
+        save_csv(books, CSV_FILE)
+        # csv旁边顺手写一份二进制快照(分析时mmap直接打开)和搜索索引
+        write_snapshot(books, snapshot_path(CSV_FILE), BOOK_FIELDS)
+        build_index(books, csv_dataset(CSV_FILE), BOOK_FIELDS)
 
 
 if __name__ == '__main__':
@@ -1,7 +1,9 @@
-import csv
 import os
+import re
 import time
 from loguru import logger
+import bench_history
+from sinks import atomic_write_csv
 
 # Task2 - 方案三: Scrapy
 # 企业级框架，自带很多特性，写起来也麻烦一点
@@ -16,6 +18,7 @@ except ImportError:
     logger.warning('scrapy未安装, 执行 pip install scrapy')
 
 RATING_MAP = {'One': 1, 'Two': 2, 'Three': 3, 'Four': 4, 'Five': 5}
+PRICE_RE = re.compile(r'\d+(?:\.\d+)?')
 MAX_PAGES = 10
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
 CSV_FILE = os.path.join(DATA_DIR, 'books_scrapy.csv')
@@ -52,7 +55,9 @@ if HAS_SCRAPY:
                 href = a.attrib.get('href', '')
                 url = 'https://books.toscrape.com/catalogue/' + href.lstrip('./')
 
-                price_text = article.css('p.price_color::text').get('').lstrip('£Â')
+                # scrapy自己按响应头/meta解码, 这里只要取出数字
+                m = PRICE_RE.search(article.css('p.price_color::text').get(''))
+                price_text = m.group() if m else '0'
                 stock = article.css('p.instock.availability::text').getall()
                 stock = ' '.join(s.strip() for s in stock).strip()
 
@@ -100,11 +105,7 @@ def run_scrapy(max_pages=MAX_PAGES):
 
 
 def save_csv(books, filepath):
-    os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    with open(filepath, 'w', newline='', encoding='utf-8-sig') as f:
-        w = csv.DictWriter(f, fieldnames=['title', 'price', 'stock', 'rating', 'url'])
-        w.writeheader()
-        w.writerows(books)
+    atomic_write_csv(books, filepath, ['title', 'price', 'stock', 'rating', 'url'])
     logger.info(f'saved {len(books)} books -> {filepath}')
 
 
@@ -120,6 +121,8 @@ def main():
 
     elapsed = time.time() - t0
     logger.info(f'Scrapy完成: {len(books)} 本, 耗时 {elapsed:.2f}s')
+    bench_history.record('crawl', 'books_scrapy', [elapsed], backend='scrapy',
+                         concurrency=4, dataset_size=len(books))
     save_csv(books, CSV_FILE)
 
 
@@ -1,4 +1,5 @@
-import csv
+import argparse
+import html
 import os
 import re
 import time
@@ -12,6 +13,7 @@ from loguru import logger
 #   2. 分析页面接口，直接requests请求 (真正的逆向)
 # books.toscrape.com是静态站，为了演示逆向流程,
 # 我们先用selenium获取完整DOM，再提取数据
+# main() 先用 render_router 探测: 普通HTTP能拿到数据就不开浏览器
 
 try:
     from selenium import webdriver
@@ -22,7 +24,9 @@ except ImportError:
     HAS_SELENIUM = False
     logger.warning('selenium未安装, 执行 pip install selenium')
 
-import requests
+import bench_history
+from render_router import TIERS, crawl_static, probe_reason, record_throughput, route
+from sinks import atomic_write_csv
 
 BASE_URL = 'https://books.toscrape.com/catalogue/page-{}.html'
 DETAIL_BASE = 'https://books.toscrape.com/catalogue/'
@@ -72,7 +76,9 @@ def parse_page_selenium(browser, url):
             href = a.get_attribute('href') or ''
 
             price_el = art.find_element(By.CSS_SELECTOR, 'p.price_color')
-            price = price_el.text.lstrip('£Â') if price_el else '0'
+            # 浏览器按页面charset解好码了, 只要取数字部分
+            m = re.search(r'\d+(?:\.\d+)?', price_el.text) if price_el else None
+            price = m.group() if m else '0'
 
             stock_el = art.find_element(By.CSS_SELECTOR, 'p.instock')
             stock = stock_el.text.strip() if stock_el else ''
@@ -118,88 +124,113 @@ def scrape_with_selenium(max_pages=MAX_PAGES):
     return all_books
 
 
-def reverse_analysis():
+# 用正则直接匹配，不依赖任何解析库
+# 这就是逆向的核心 - 理解数据在HTML中的位置
+# 直接在bytes上匹配, 只把抠出来的字段解码, 整页不用先转成str
+# 先按article切块再在块里找字段: star-rating在h3前面, 一个大正则跨article匹配会吞掉下一本书
+ARTICLE_RE = re.compile(rb'<article class="product_pod">(.*?)</article>', re.DOTALL)
+HREF_TITLE_RE = re.compile(rb'<h3><a href="(?P<href>[^"]+)" title="(?P<title>[^"]*)"')
+PRICE_RE = re.compile(rb'<p class="price_color">[^<0-9]*(?P<price>\d+(?:\.\d+)?)</p>')
+STAR_RE = re.compile(rb'<p class="star-rating (?P<star>\w+)"')
+STOCK_RE = re.compile(rb'<p class="instock availability">\s*(?:<i[^>]*></i>)?\s*(?P<stock>[^<]+?)\s*</p>')
+META_CHARSET_RE = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.IGNORECASE)
+
+
+def parse_page_regex(content, encoding=None):
     """
-    逆向思路2: 分析站点结构，找到数据接口或规律
-    用requests + 正则提取，不依赖任何HTML解析库
+    正则解析一页列表
+    :param content: 原始bytes(也兼容str)
+    :param encoding: 响应头声明的charset, 没有就看<meta charset>, 再没有按utf-8
     :return: list[dict]
     """
-    logger.info('正则逆向方案: 分析HTML结构后直接正则匹配')
+    if isinstance(content, str):
+        content, encoding = content.encode('utf-8'), 'utf-8'
+    if not encoding:
+        m = META_CHARSET_RE.search(content, 0, 2048)
+        encoding = m.group(1).decode('ascii') if m else 'utf-8'
 
-    session = requests.Session()
-    session.headers.update({
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
-                      'AppleWebKit/537.36 Chrome/122.0.0.0'
-    })
+    def text(m, group):
+        return html.unescape(m.group(group).decode(encoding, 'replace')) if m else ''
 
     books = []
-    for page in range(1, MAX_PAGES + 1):
-        url = BASE_URL.format(page)
-        resp = session.get(url, timeout=10)
-        html = resp.text
-
-        # 用正则直接匹配，不依赖任何解析库
-        # 这就是逆向的核心 - 理解数据在HTML中的位置
-        pattern = re.compile(
-            r'<article class="product_pod">.*?'
-            r'<a href="(?P<href>[^"]+)".*?title="(?P<title>[^"]*)".*?'
-            r'<p class="price_color">(?P<price>[^<]+)</p>.*?'
-            r'<p class="star-rating (?P<star>\w+)"',
-            re.DOTALL
-        )
-
-        for m in pattern.finditer(html):
-            title = m.group('title')
-            href = m.group('href')
-            price = m.group('price').strip().lstrip('£Â')
-            star_word = m.group('star')
-            rating = RATING_MAP.get(star_word, 0)
-
-            books.append({
-                'title': title,
-                'price': price,
-                'stock': 'In stock',
-                'rating': rating,
-                'url': DETAIL_BASE + href.lstrip('./')
-            })
+    for block in ARTICLE_RE.finditer(content):
+        block = block.group(1)
+        link = HREF_TITLE_RE.search(block)
+        if not link:
+            continue
+        price = PRICE_RE.search(block)
+        star = STAR_RE.search(block)
+
+        books.append({
+            'title': text(link, 'title'),
+            'price': text(price, 'price') or '0',
+            'stock': text(STOCK_RE.search(block), 'stock'),
+            'rating': RATING_MAP.get(text(star, 'star'), 0),
+            'url': DETAIL_BASE + text(link, 'href').lstrip('./')
+        })
+    return books
 
-        logger.info(f'[regex] page {page}: total {len(books)} books so far')
 
-    session.close()
-    return books
+def reverse_analysis():
+    """
+    逆向思路2: 分析站点结构，找到数据接口或规律
+    用requests + 正则提取，不依赖任何HTML解析库
+    :return: list[dict]
+    """
+    logger.info('正则逆向方案: 分析HTML结构后直接正则匹配')
+    urls = [BASE_URL.format(page) for page in range(1, MAX_PAGES + 1)]
+    return crawl_static('books', urls, 'regex')
 
 
 def save_csv(books, filepath):
-    os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    with open(filepath, 'w', newline='', encoding='utf-8-sig') as f:
-        w = csv.DictWriter(f, fieldnames=['title', 'price', 'stock', 'rating', 'url'])
-        w.writeheader()
-        w.writerows(books)
+    atomic_write_csv(books, filepath, ['title', 'price', 'stock', 'rating', 'url'])
     logger.info(f'saved {len(books)} books -> {filepath}')
 
 
+def report_run(tier, engine, backend, urls, books, elapsed):
+    """打日志 + 写bench历史 + 记录档位吞吐 + 保存csv"""
+    logger.info(f'{engine}完成: {len(books)} 本, 耗时 {elapsed:.2f}s, {len(urls) / elapsed:.2f} 页/s')
+    bench_history.record('crawl', engine, [elapsed], backend=backend,
+                         concurrency=1, dataset_size=len(books))
+    record_throughput('books', tier, len(urls), len(books), elapsed)
+    save_csv(books, CSV_FILE)
+
+
 def main():
+    ap = argparse.ArgumentParser(description='Task2 方案4: 逆向分析 + Selenium')
+    ap.add_argument('--tier', choices=TIERS, help='指定档位, 不探测')
+    ap.add_argument('--reprobe', action='store_true', help='忽略缓存, 重新探测档位')
+    args = ap.parse_args()
+
     logger.info('Task2 方案4: 逆向分析')
+    urls = [BASE_URL.format(page) for page in range(1, MAX_PAGES + 1)]
+    tier = args.tier or route(urls[0], refresh=args.reprobe)
+    logger.info(f'渲染档位: {tier}')
     t0 = time.time()
 
-    if HAS_SELENIUM:
-        # 有selenium就用selenium方案
-        logger.info('Selenium headless browser 爬取开始...')
-        try:
-            books = scrape_with_selenium(MAX_PAGES)
-            elapsed = time.time() - t0
-            logger.info(f'Selenium完成: {len(books)} 本, 耗时 {elapsed:.2f}s')
-            save_csv(books, CSV_FILE)
-            return
-        except Exception as e:
-            logger.error(f'Selenium爬取失败: {e}')
-            logger.info('fallback到正则逆向方案...')
-
-    # 没selenium或selenium失败，fallback到正则方案
-    books = reverse_analysis()
-    elapsed = time.time() - t0
-    logger.info(f'正则逆向完成: {len(books)} 本, 耗时 {elapsed:.2f}s')
-    save_csv(books, CSV_FILE)
+    if tier == 'browser':
+        if HAS_SELENIUM:
+            logger.info('Selenium headless browser 爬取开始...')
+            try:
+                books = scrape_with_selenium(MAX_PAGES)
+                report_run('browser', 'books_selenium', 'selenium', urls, books, time.time() - t0)
+                return
+            except Exception as e:
+                logger.error(f'Selenium爬取失败: {e}')
+        # 探测选了browser说明静态档位没验证过(请求失败)或者验证没过, 不能直接当正则能用:
+        # 先重新探测一次, 还是browser就照跑正则, 但明确这次结果未经验证
+        if not args.tier and not args.reprobe:
+            tier = route(urls[0], refresh=True)
+        if tier == 'browser':
+            reason = '手动指定 --tier browser' if args.tier else probe_reason('books')
+            logger.warning(f'静态档位未通过探测({reason}), fallback到正则逆向方案, 本次结果未经验证, 请检查输出')
+            tier = 'regex'
+        else:
+            logger.info(f'重新探测后档位: {tier}')
+        t0 = time.time()
+
+    books = reverse_analysis() if tier == 'regex' else crawl_static('books', urls, tier)
+    report_run(tier, f'books_{tier}', tier, urls, books, time.time() - t0)
 
 
 if __name__ == '__main__':
@@ -1,10 +1,16 @@
-import csv
+import argparse
 import os
 import re
 import time
 import requests
 from bs4 import BeautifulSoup
 from loguru import logger
+import bench_history
+from archive import WarcWriter, default_warc_path
+from http_client import declared_charset
+from search_index import build_index, csv_dataset
+from sinks import atomic_write_csv, write_partitioned
+from snapshot import snapshot_path, write_snapshot
 
 # 豆瓣Top250基础爬虫 - 串行版本
 
@@ -108,16 +114,20 @@ def parse_item(item):
     }
 
 
-def scrape_page(session, start):
+def scrape_page(session, start, archive=None):
     """
     抓取单页25部电影
     :param session: requests.Session
     :param start: 起始偏移量
+    :param archive: WarcWriter, 可选, 存原始响应
     :return: list[dict]
     """
     resp = session.get(BASE_URL, params={'start': start}, timeout=10)
     resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, 'lxml')
+    if archive is not None:
+        archive.write_response(resp.url, resp.status_code, resp.headers.items(), resp.content, resp.reason)
+    soup = BeautifulSoup(resp.content, 'lxml',
+                         from_encoding=declared_charset(resp.headers.get('Content-Type')))
     items = soup.find_all('div', class_='item')
     logger.info(f'page start={start} got {len(items)} items')
     return [parse_item(it) for it in items]
@@ -129,33 +139,50 @@ def save_csv(movies, filepath):
     :param movies: list[dict]
     :param filepath: 文件路径
     """
-    os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    with open(filepath, 'w', newline='', encoding='utf-8-sig') as f:
-        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
-        writer.writeheader()
-        writer.writerows(movies)
+    atomic_write_csv(movies, filepath, CSV_FIELDS)
     logger.info(f'saved {len(movies)} records -> {filepath}')
 
 
 def main():
+    ap = argparse.ArgumentParser(description='豆瓣Top250 串行爬虫')
+    ap.add_argument('--warc', action='store_true',
+                    help='把原始响应存到 data/warc/, 之后可用 archive.py reparse 离线重解析')
+    ap.add_argument('--partitioned', action='store_true',
+                    help='写成按日期/run分区的压缩分块 data/douban_movies/, 不再覆盖单个csv')
+    ap.add_argument('--codec', choices=['gzip', 'zstd'], default='gzip', help='分区压缩格式')
+    args = ap.parse_args()
+
     session = get_session()
+    archive = WarcWriter(default_warc_path('douban_scrape')) if args.warc else None
     all_movies = []
     t_start = time.time()
 
-    for start in range(0, 250, 25):
-        try:
-            page_data = scrape_page(session, start)
-            all_movies.extend(page_data)
-            # 别太快，豆瓣会ban
-            time.sleep(1)
-        except Exception as e:
-            logger.error(f'page start={start} failed: {e}')
-            continue
+    try:
+        for start in range(0, 250, 25):
+            try:
+                page_data = scrape_page(session, start, archive)
+                all_movies.extend(page_data)
+                # 别太快，豆瓣会ban
+                time.sleep(1)
+            except Exception as e:
+                logger.error(f'page start={start} failed: {e}')
+                continue
+    finally:
+        if archive:
+            archive.close()
 
     t_fetch = time.time() - t_start
     logger.info(f'串行抓取完成: {len(all_movies)} 部, 爬取耗时 {t_fetch:.2f}s')
-
-    save_csv(all_movies, CSV_FILE)
+    bench_history.record('crawl', 'douban_scrape', [t_fetch], backend='bs4',
+                         concurrency=1, dataset_size=len(all_movies))
+
+    if args.partitioned:
+        write_partitioned(all_movies, 'douban_movies', CSV_FIELDS, codec=args.codec)
+    else:
+        save_csv(all_movies, CSV_FILE)
+        # csv旁边顺手写一份二进制快照(分析时mmap直接打开)和搜索索引
+        write_snapshot(all_movies, snapshot_path(CSV_FILE), CSV_FIELDS)
+        build_index(all_movies, csv_dataset(CSV_FILE), CSV_FIELDS)
     t_total = time.time() - t_start
     logger.info(f'总耗时(含写入): {t_total:.2f}s')
 
@@ -1,6 +1,5 @@
 import argparse
 import asyncio
-import csv
 import os
 import re
 import time
@@ -8,6 +7,13 @@ import aiohttp
 import requests
 from bs4 import BeautifulSoup
 from loguru import logger
+import bench_history
+from archive import WarcWriter, default_warc_path
+from assets import download_assets, extract_image_urls
+from http_client import make_session, new_event_loop, prewarm
+from search_index import build_index, csv_dataset
+from sinks import atomic_write_csv, write_partitioned
+from snapshot import snapshot_path, write_snapshot
 
 # 豆瓣Top250优化爬虫 - aiohttp并发版本
 # 跑完async之后可以选择性跑一次串行做对比
@@ -90,12 +96,14 @@ def parse_item(item):
     }
 
 
-async def fetch_page(session, start, sem):
+async def fetch_page(session, start, sem, archive=None, images=None):
     """
     异步抓取单页
     :param session: aiohttp.ClientSession
     :param start: 偏移量
     :param sem: asyncio.Semaphore
+    :param archive: WarcWriter, 可选, 存原始响应
+    :param images: list, 可选, 海报url (url, 来源页) 追加进去
     :return: list[dict]
     """
     url = f'{BASE_URL}?start={start}'
@@ -103,8 +111,12 @@ async def fetch_page(session, start, sem):
         try:
             async with session.get(url, timeout=aiohttp.ClientTimeout(total=10)) as resp:
                 resp.raise_for_status()
-                html = await resp.text()
-                soup = BeautifulSoup(html, 'lxml')
+                body = await resp.read()
+                if archive is not None:
+                    archive.write_response(url, resp.status, resp.headers.items(), body, resp.reason)
+                if images is not None:
+                    images.extend((u, url) for u in extract_image_urls(body, url, resp.charset))
+                soup = BeautifulSoup(body, 'lxml', from_encoding=resp.charset)
                 items = soup.find_all('div', class_='item')
                 logger.info(f'[async] start={start} got {len(items)} items')
                 # 加个小延迟，每个协程之间错开
@@ -115,15 +127,21 @@ async def fetch_page(session, start, sem):
             return []
 
 
-async def scrape_all():
+async def scrape_all(archive=None, assets=False):
     """
     并发抓取全部10页
-    :return: list[dict]
+    :param archive: WarcWriter, 可选
+    :param assets: 爬完在同一个session上下载海报(并发和带宽走assets自己的预算)
+    :return: (list[dict], 海报下载统计 or None)
     """
     sem = asyncio.Semaphore(CONCURRENCY)
-    async with aiohttp.ClientSession(headers=HEADERS) as session:
-        tasks = [fetch_page(session, start, sem) for start in range(0, 250, 25)]
+    images = [] if assets else None
+    async with make_session(HEADERS, limit_per_host=CONCURRENCY) as session:
+        # 先把CONCURRENCY条连接建好, 第一批请求不用再等握手
+        await prewarm(session, [BASE_URL], CONCURRENCY)
+        tasks = [fetch_page(session, start, sem, archive, images) for start in range(0, 250, 25)]
         results = await asyncio.gather(*tasks)
+        asset_stats = await download_assets(images, session=session) if images else None
 
     # 合并结果
     movies = []
@@ -132,7 +150,7 @@ async def scrape_all():
 
     # 按rank排序
     movies.sort(key=lambda x: int(x['rank']) if x['rank'].isdigit() else 999)
-    return movies
+    return movies, asset_stats
 
 
 def save_csv(movies, filepath):
@@ -141,11 +159,7 @@ def save_csv(movies, filepath):
     :param movies: list[dict]
     :param filepath: str
     """
-    os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    with open(filepath, 'w', newline='', encoding='utf-8-sig') as f:
-        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
-        writer.writeheader()
-        writer.writerows(movies)
+    atomic_write_csv(movies, filepath, CSV_FIELDS)
     logger.info(f'saved {len(movies)} records -> {filepath}')
 
 
@@ -169,7 +183,7 @@ def measure_serial_baseline():
         try:
             resp = session.get(BASE_URL, params={'start': start}, timeout=10)
             resp.raise_for_status()
-            soup = BeautifulSoup(resp.text, 'lxml')
+            soup = BeautifulSoup(resp.content, 'lxml')
             items = soup.find_all('div', class_='item')
             count += len(items)
             time.sleep(1)
@@ -184,26 +198,48 @@ def main():
     ap = argparse.ArgumentParser(description='豆瓣Top250 aiohttp优化爬虫')
     ap.add_argument('--skip-benchmark', action='store_true',
                     help='跳过串行基准测试，只跑并发')
+    ap.add_argument('--warc', action='store_true',
+                    help='把原始响应存到 data/warc/, 之后可用 archive.py reparse 离线重解析')
+    ap.add_argument('--partitioned', action='store_true',
+                    help='写成按日期/run分区的压缩分块 data/douban_movies_optimized/, 不再覆盖单个csv')
+    ap.add_argument('--codec', choices=['gzip', 'zstd'], default='gzip', help='分区压缩格式')
+    ap.add_argument('--assets', action='store_true', help='爬完顺手下载海报到 data/assets/')
     args = ap.parse_args()
 
     # === 并发爬取 ===
     logger.info('豆瓣Top250 优化版 (aiohttp并发) 开始...')
     t_start = time.time()
 
-    loop = asyncio.new_event_loop()
-    movies = loop.run_until_complete(scrape_all())
-    loop.close()
+    archive = WarcWriter(default_warc_path('douban_scrape_optimized')) if args.warc else None
+    loop = new_event_loop()
+    try:
+        movies, asset_stats = loop.run_until_complete(scrape_all(archive, args.assets))
+    finally:
+        loop.close()
+        if archive:
+            archive.close()
+    # 海报不算进爬取耗时, 有自己的带宽预算
+    async_elapsed = time.time() - t_start - (asset_stats['elapsed_s'] if asset_stats else 0)
 
-    async_elapsed = time.time() - t_start
     logger.info(f'并发抓取完成: {len(movies)} 部, 耗时 {async_elapsed:.2f}s')
+    bench_history.record('crawl', 'douban_scrape_optimized', [async_elapsed], backend='bs4',
+                         concurrency=CONCURRENCY, dataset_size=len(movies))
 
-    save_csv(movies, CSV_FILE)
+    if args.partitioned:
+        write_partitioned(movies, 'douban_movies_optimized', CSV_FIELDS, codec=args.codec)
+    else:
+        save_csv(movies, CSV_FILE)
+        # csv旁边顺手写一份二进制快照(分析时mmap直接打开)和搜索索引
+        write_snapshot(movies, snapshot_path(CSV_FILE), CSV_FIELDS)
+        build_index(movies, csv_dataset(CSV_FILE), CSV_FIELDS)
 
     # === 串行基准对比 ===
     if not args.skip_benchmark:
         logger.info('开始串行基准测试 (用于对比加速比)...')
         serial_elapsed, serial_count = measure_serial_baseline()
         logger.info(f'串行基准: {serial_count} 部, 耗时 {serial_elapsed:.2f}s')
+        bench_history.record('crawl', 'douban_serial_baseline', [serial_elapsed], backend='bs4',
+                             concurrency=1, dataset_size=serial_count)
         speedup = serial_elapsed / async_elapsed if async_elapsed > 0 else 0
         logger.info(f'加速比: {speedup:.1f}x  ({serial_elapsed:.2f}s -> {async_elapsed:.2f}s)')
     else:
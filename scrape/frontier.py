@@ -0,0 +1,337 @@
+import argparse
+import heapq
+import json
+import os
+import socket
+import sqlite3
+import time
+from urllib.parse import urlsplit
+from loguru import logger
+from archive import PARSERS, BOOK_FIELDS, MOVIE_FIELDS, page_key, save_csv
+from http_client import declared_charset, make_requests_session
+
+# 分布式抓取: 共享的URL队列 + 租约
+# frontier放在共享存储里(这里是SQLite文件, 放NFS/共享盘上), 多台机器上的
+# worker各自领一批url, 领到的url带过期时间, worker挂了租约过期会自动回到队列
+# 每个host的礼貌间隔记在库里, 所以不管开多少个worker, 对同一个站的请求频率是全局的
+#
+# 用法:
+#   python scrape/frontier.py seed --site douban --site books
+#   python scrape/frontier.py work            # 每台机器开几个都行
+#   python scrape/frontier.py stats
+#   python scrape/frontier.py export --site books
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+DB_FILE = os.path.join(DATA_DIR, 'frontier.sqlite')
+LEASE_SECONDS = 60
+MAX_ATTEMPTS = 3
+# 一批里同一个host最多领几个, 剩下的留给别的worker, 各worker都能分到每个站点的活
+HOST_BATCH = 3
+# 每个host两次请求之间的最小间隔(秒)，全局生效
+HOST_DELAY = {
+    'movie.douban.com': 1.0,
+    'books.toscrape.com': 0.3,
+}
+DEFAULT_HOST_DELAY = 1.0
+UA = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
+      'AppleWebKit/537.36 (KHTML, like Gecko) '
+      'Chrome/122.0.0.0 Safari/537.36')
+# site -> (解析后端, 种子url, 字段, 请求头)
+SITES = {
+    'douban': ('douban_bs4',
+               [f'https://movie.douban.com/top250?start={s}' for s in range(0, 250, 25)],
+               MOVIE_FIELDS,
+               {'User-Agent': UA, 'Referer': 'https://movie.douban.com/',
+                'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'}),
+    'books': ('books_bs4',
+              [f'https://books.toscrape.com/catalogue/page-{p}.html' for p in range(1, 11)],
+              BOOK_FIELDS,
+              {'User-Agent': UA}),
+}
+
+
+class WorkQueue(object):
+    """
+    frontier接口
+    以后换成 Redis / RabbitMQ 之类的broker, 实现这几个方法就能直接替换
+    """
+
+    def push(self, urls, site):
+        """入队, 已存在的url忽略"""
+        raise NotImplementedError
+
+    def claim(self, worker_id, batch_size, lease_seconds=LEASE_SECONDS):
+        """
+        领一批url
+        :return: list[(url, site, not_before)], not_before之前不许请求(host礼貌间隔)
+        """
+        raise NotImplementedError
+
+    def complete(self, url, worker_id, records):
+        """提交结果并释放租约, 租约已经被别人拿走时返回False"""
+        raise NotImplementedError
+
+    def fail(self, url, worker_id, error):
+        """失败, 没超过重试次数就放回队列"""
+        raise NotImplementedError
+
+    def results(self, site):
+        """取某个站点已完成的结果: list[(url, records)]"""
+        raise NotImplementedError
+
+    def stats(self):
+        """{state: count}"""
+        raise NotImplementedError
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """
+    基于SQLite文件的实现
+    共享盘上WAL不可靠, 所以用默认的rollback journal + BEGIN IMMEDIATE加写锁
+    """
+
+    def __init__(self, filepath=DB_FILE, host_delay=None, max_attempts=MAX_ATTEMPTS, host_batch=HOST_BATCH):
+        os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+        self.host_delay = dict(HOST_DELAY, **(host_delay or {}))
+        self.max_attempts = max_attempts
+        self.host_batch = host_batch
+        self.conn = sqlite3.connect(filepath, timeout=30, isolation_level=None)
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS frontier (
+                url TEXT PRIMARY KEY,
+                site TEXT NOT NULL,
+                host TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires REAL,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_frontier_state ON frontier(state, host);
+            CREATE TABLE IF NOT EXISTS hosts (
+                host TEXT PRIMARY KEY,
+                next_allowed REAL NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS results (
+                url TEXT PRIMARY KEY,
+                site TEXT NOT NULL,
+                records TEXT NOT NULL,
+                worker TEXT,
+                finished_at REAL
+            );
+        ''')
+
+    def _tx(self):
+        """写事务, 一开始就拿写锁, 避免两个worker领到同一批"""
+        self.conn.execute('BEGIN IMMEDIATE')
+
+    def push(self, urls, site):
+        self._tx()
+        try:
+            for url in urls:
+                self.conn.execute(
+                    'INSERT OR IGNORE INTO frontier (url, site, host) VALUES (?, ?, ?)',
+                    (url, site, urlsplit(url).hostname or ''))
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+
+    def claim(self, worker_id, batch_size, lease_seconds=LEASE_SECONDS):
+        now = time.time()
+        self._tx()
+        try:
+            # 过期租约回队列; 和fail()同一条规则, 反复把worker搞崩/卡死的url重试够次数就放弃
+            self.conn.execute(
+                "UPDATE frontier SET state=CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "lease_owner=NULL, lease_expires=NULL, error='lease expired' "
+                "WHERE state='leased' AND lease_expires < ?", (self.max_attempts, now))
+            rows = self.conn.execute(
+                "SELECT f.url, f.site, f.host, COALESCE(h.next_allowed, 0) "
+                "FROM frontier f LEFT JOIN hosts h ON h.host = f.host "
+                "WHERE f.state='pending' ORDER BY f.attempts, f.rowid").fetchall()
+
+            # 按host分组, 每次从最早能请求的host里取一个, 多个站点轮着领
+            pending = {}
+            heap = []
+            for url, site, host, next_allowed in rows:
+                if host not in pending:
+                    pending[host] = []
+                    heap.append((max(now, next_allowed), host))
+                pending[host].append((url, site))
+            heapq.heapify(heap)
+
+            claimed = []
+            next_slot = {}
+            taken = {}
+            while heap and len(claimed) < batch_size:
+                slot, host = heapq.heappop(heap)
+                # 最早的都排得太靠后就不领了，不然等轮到它租约都快过期了
+                if slot > now + lease_seconds / 2:
+                    break
+                n = taken.get(host, 0)
+                url, site = pending[host][n]
+                claimed.append((url, site, slot))
+                taken[host] = n + 1
+                next_slot[host] = slot + self.host_delay.get(host, DEFAULT_HOST_DELAY)
+                if n + 1 < min(self.host_batch, len(pending[host])):
+                    heapq.heappush(heap, (next_slot[host], host))
+
+            expires = now + lease_seconds
+            for url, _, slot in claimed:
+                self.conn.execute(
+                    "UPDATE frontier SET state='leased', lease_owner=?, lease_expires=?, "
+                    "attempts=attempts+1 WHERE url=?", (worker_id, expires, url))
+            for host, slot in next_slot.items():
+                self.conn.execute(
+                    'INSERT INTO hosts (host, next_allowed) VALUES (?, ?) '
+                    'ON CONFLICT(host) DO UPDATE SET next_allowed=excluded.next_allowed',
+                    (host, slot))
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+        return claimed
+
+    def complete(self, url, worker_id, records):
+        self._tx()
+        try:
+            cur = self.conn.execute(
+                "UPDATE frontier SET state='done', lease_owner=NULL, lease_expires=NULL, error=NULL "
+                "WHERE url=? AND state='leased' AND lease_owner=?", (url, worker_id))
+            ok = cur.rowcount == 1
+            if ok:
+                site = self.conn.execute('SELECT site FROM frontier WHERE url=?', (url,)).fetchone()[0]
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO results (url, site, records, worker, finished_at) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (url, site, json.dumps(records, ensure_ascii=False), worker_id, time.time()))
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+        return ok
+
+    def fail(self, url, worker_id, error):
+        self._tx()
+        try:
+            self.conn.execute(
+                "UPDATE frontier SET state=CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "lease_owner=NULL, lease_expires=NULL, error=? "
+                "WHERE url=? AND state='leased' AND lease_owner=?",
+                (self.max_attempts, str(error)[:500], url, worker_id))
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+
+    def results(self, site):
+        rows = self.conn.execute('SELECT url, records FROM results WHERE site=?', (site,))
+        return [(url, json.loads(records)) for url, records in rows]
+
+    def stats(self):
+        rows = self.conn.execute('SELECT state, COUNT(*) FROM frontier GROUP BY state')
+        return dict(rows.fetchall())
+
+    def close(self):
+        self.conn.close()
+
+
+def run_worker(queue, worker_id, batch_size=5, forever=False, idle_sleep=2.0):
+    """
+    worker主循环: 领一批 -> 按not_before等待 -> 请求+解析 -> 提交
+    豆瓣和books的url由同一个worker处理, 按site分派解析器
+    :param queue: WorkQueue
+    :param worker_id: 全局唯一, 默认 hostname:pid
+    :param forever: False时队列空了就退出
+    :return: 处理成功的url数
+    """
+    sessions = {}
+    done = 0
+    while True:
+        batch = queue.claim(worker_id, batch_size)
+        if not batch:
+            stats = queue.stats()
+            if not forever and not stats.get('pending') and not stats.get('leased'):
+                break
+            time.sleep(idle_sleep)
+            continue
+
+        for url, site, not_before in batch:
+            wait = not_before - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            parser_name, _, _, headers = SITES[site]
+            sess = sessions.get(site)
+            if sess is None:
+                sess = sessions[site] = make_requests_session(headers)
+            try:
+                resp = sess.get(url, timeout=10)
+                resp.raise_for_status()
+                records = PARSERS[parser_name][0](
+                    resp.content, url, declared_charset(resp.headers.get('Content-Type')))
+            except Exception as e:
+                logger.error(f'[{worker_id}] {url} failed: {e}')
+                queue.fail(url, worker_id, e)
+                continue
+            if queue.complete(url, worker_id, records):
+                done += 1
+                logger.info(f'[{worker_id}] {url}: {len(records)} records')
+            else:
+                logger.warning(f'[{worker_id}] lease lost, dropped {url}')
+
+    for sess in sessions.values():
+        sess.close()
+    return done
+
+
+def export(queue, site, filepath):
+    """把某站点的结果按页序合并写csv"""
+    pages = sorted(queue.results(site), key=lambda p: page_key(p[0]))
+    records = []
+    for _, recs in pages:
+        records.extend(recs)
+    if site == 'douban':
+        records.sort(key=lambda x: int(x['rank']) if x['rank'].isdigit() else 999)
+    save_csv(records, filepath, SITES[site][2])
+
+
+def main():
+    ap = argparse.ArgumentParser(description='分布式抓取: 共享frontier + 租约')
+    ap.add_argument('--db', default=DB_FILE, help='frontier数据库, 放在共享盘上')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+
+    p_seed = sub.add_parser('seed', help='种子url入队')
+    p_seed.add_argument('--site', action='append', choices=sorted(SITES), required=True)
+
+    p_work = sub.add_parser('work', help='启动一个worker')
+    p_work.add_argument('--worker-id', default=f'{socket.gethostname()}:{os.getpid()}')
+    p_work.add_argument('--batch', type=int, default=5, help='每次领多少个url')
+    p_work.add_argument('--forever', action='store_true', help='队列空了也不退出')
+
+    sub.add_parser('stats', help='队列状态')
+
+    p_exp = sub.add_parser('export', help='结果导出csv')
+    p_exp.add_argument('--site', choices=sorted(SITES), required=True)
+    p_exp.add_argument('--out', help='默认 data/distributed_<site>.csv')
+
+    args = ap.parse_args()
+    queue = SQLiteWorkQueue(args.db)
+
+    if args.cmd == 'seed':
+        for site in args.site:
+            queue.push(SITES[site][1], site)
+            logger.info(f'seeded {len(SITES[site][1])} urls for {site}')
+    elif args.cmd == 'work':
+        t0 = time.time()
+        n = run_worker(queue, args.worker_id, args.batch, args.forever)
+        logger.info(f'[{args.worker_id}] 完成 {n} 个url, 耗时 {time.time() - t0:.2f}s')
+    elif args.cmd == 'stats':
+        print(json.dumps(queue.stats()))
+    elif args.cmd == 'export':
+        export(queue, args.site, args.out or os.path.join(DATA_DIR, f'distributed_{args.site}.csv'))
+    queue.close()
+
+
+if __name__ == '__main__':
+    main()
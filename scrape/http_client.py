@@ -0,0 +1,147 @@
+import asyncio
+from urllib.parse import urlsplit
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from loguru import logger
+
+# 统一的连接层
+# 之前每个脚本都是 aiohttp.ClientSession(headers=HEADERS) / requests.Session() 默认配置,
+# 连接池大小、DNS缓存、keep-alive都没法控制。这里集中成几个工厂函数:
+#   make_session()           aiohttp, 可配 limit_per_host / DNS缓存TTL / keep-alive
+#   prewarm()                第一批请求之前先把连接建好(TCP+TLS握手不算在第一批里)
+#   make_requests_session()  requests, 连接池大小和重试
+#   new_event_loop()         装了uvloop就用uvloop
+
+LIMIT = 100
+LIMIT_PER_HOST = 5
+DNS_TTL = 600           # 秒, aiohttp默认只有10s
+KEEPALIVE = 60          # 秒, aiohttp默认15s
+
+try:
+    import brotli  # noqa: F401  aiohttp/urllib3 装了brotli才能解br
+    HAS_BROTLI = True
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        HAS_BROTLI = True
+    except ImportError:
+        HAS_BROTLI = False
+
+try:
+    import uvloop
+    HAS_UVLOOP = True
+except ImportError:
+    HAS_UVLOOP = False
+
+
+def accept_encoding():
+    """能解什么压缩就声明什么, br通常比gzip再小15%左右"""
+    return 'gzip, deflate, br' if HAS_BROTLI else 'gzip, deflate'
+
+
+def declared_charset(content_type):
+    """
+    从Content-Type里取charset, 没声明返回None, 交给lxml去看页面里的<meta charset>
+    requests在text/html没声明charset时会默认ISO-8859-1, '£'(c2 a3)就被解成了'Â£'
+    :param content_type: Content-Type头
+    :return: str or None
+    """
+    if not content_type:
+        return None
+    for part in content_type.split(';')[1:]:
+        name, _, value = part.strip().partition('=')
+        if name.lower() == 'charset':
+            return value.strip('"\' ') or None
+    return None
+
+
+def make_connector(limit=LIMIT, limit_per_host=LIMIT_PER_HOST, dns_ttl=DNS_TTL,
+                   keepalive=KEEPALIVE):
+    """
+    :param limit: 总连接数上限
+    :param limit_per_host: 单host连接数上限, 和脚本的并发数对齐
+    :param dns_ttl: DNS缓存时间(秒), None表示永久
+    :param keepalive: 空闲连接保留时间(秒)
+    :return: aiohttp.TCPConnector
+    """
+    return aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit_per_host,
+        use_dns_cache=True,
+        ttl_dns_cache=dns_ttl,
+        keepalive_timeout=keepalive,
+    )
+
+
+def make_session(headers=None, limit=LIMIT, limit_per_host=LIMIT_PER_HOST,
+                 dns_ttl=DNS_TTL, keepalive=KEEPALIVE, trace_configs=None, **kwargs):
+    """
+    创建调好参数的aiohttp session
+    :param headers: 默认请求头, 会补上 Accept-Encoding
+    :return: aiohttp.ClientSession
+    """
+    headers = dict(headers or {})
+    headers.setdefault('Accept-Encoding', accept_encoding())
+    return aiohttp.ClientSession(
+        headers=headers,
+        connector=make_connector(limit, limit_per_host, dns_ttl, keepalive),
+        trace_configs=trace_configs,
+        **kwargs
+    )
+
+
+async def prewarm(session, urls, per_host=LIMIT_PER_HOST):
+    """
+    预热: 每个host先并发发几个HEAD, 把DNS解析和TCP/TLS握手提前做掉,
+    连接留在池里给后面的正式请求复用
+    :param session: make_session() 创建的session
+    :param urls: 要访问的url(取其中的host)
+    :param per_host: 每个host建几条连接, 一般等于并发数
+    :return: 成功建立的连接数
+    """
+    origins = {}
+    for url in urls:
+        parts = urlsplit(url)
+        origins.setdefault(f'{parts.scheme}://{parts.netloc}/', None)
+
+    async def head(origin):
+        try:
+            async with session.head(origin, allow_redirects=False,
+                                    timeout=aiohttp.ClientTimeout(total=5)) as resp:
+                await resp.release()
+                return True
+        except Exception as e:
+            logger.debug(f'prewarm {origin} failed: {e}')
+            return False
+
+    results = await asyncio.gather(*[head(o) for o in origins for _ in range(per_host)])
+    warmed = sum(results)
+    logger.debug(f'prewarmed {warmed} connections to {len(origins)} hosts')
+    return warmed
+
+
+def make_requests_session(headers=None, pool_maxsize=LIMIT_PER_HOST, retries=3):
+    """
+    requests版: 连接池和并发对齐, 带重试
+    :param headers: 默认请求头
+    :param pool_maxsize: 每个host保留的连接数
+    :param retries: 5xx重试次数
+    :return: requests.Session
+    """
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=[500, 502, 503])
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(headers or {})
+    session.headers['Accept-Encoding'] = accept_encoding()
+    return session
+
+
+def new_event_loop(use_uvloop=True):
+    """装了uvloop就用uvloop, 否则标准asyncio loop"""
+    if use_uvloop and HAS_UVLOOP:
+        return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import re
+import time
+from loguru import logger
+from archive import PARSERS
+from frontier import SITES
+from http_client import declared_charset, make_requests_session
+from sinks import atomic_write_bytes
+
+# 渲染层路由: 能用普通HTTP就不开浏览器
+# 先用requests抓一个样例页, 从便宜到贵依次试: regex -> lxml -> browser,
+# 第一个能拿到足够记录、关键字段不空的就是这个站点(url模式)的档位, 结果缓存在
+# data/render_tiers.json, 过期或 --refresh 才重新探测; 只有样例页抓到了但静态档位都不行
+# (页面要JS渲染)才长期缓存browser, 样例页没抓到的只缓存 RETRY_TTL
+#
+# 用法:
+#   python scrape/render_router.py probe --site books --refresh
+#   python scrape/render_router.py show               # 各站点档位 + 各档位吞吐
+#   python scrape/books_selenium.py                    # 按缓存的档位爬
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+CACHE_FILE = os.path.join(DATA_DIR, 'render_tiers.json')
+CACHE_TTL = 7 * 86400
+# 样例页没抓到(超时/DNS/5xx/403)不代表站点要JS渲染, 这种browser结果只缓存一小会儿就重新探测
+RETRY_TTL = 600
+TIERS = ['regex', 'lxml', 'browser']
+# site -> url模式, 样例页, 最少记录数, 必须有值的字段, 各静态档位用的解析后端(archive.PARSERS)
+ROUTES = {
+    'books': {
+        'pattern': r'^https?://books\.toscrape\.com/catalogue/page-\d+\.html',
+        'sample': SITES['books'][1][0],
+        'min_records': 20,
+        'required': ['title', 'price', 'url'],
+        'parsers': {'regex': 'books_regex', 'lxml': 'books_pyquery'},
+    },
+}
+
+
+def site_for_url(url):
+    for site, route in ROUTES.items():
+        if re.match(route['pattern'], url):
+            return site
+    return None
+
+
+def load_cache(filepath=CACHE_FILE):
+    if not os.path.exists(filepath):
+        return {}
+    with open(filepath, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_cache(cache, filepath=CACHE_FILE):
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    atomic_write_bytes(filepath, json.dumps(cache, ensure_ascii=False, indent=2).encode('utf-8'))
+
+
+def check_records(records, route):
+    """
+    记录数够, 且必填字段至少90%的记录有值, 才算这个档位能用
+    :return: (ok, 原因)
+    """
+    if len(records) < route['min_records']:
+        return False, f'{len(records)} records < {route["min_records"]}'
+    for field in route['required']:
+        filled = sum(1 for r in records if str(r.get(field) or '').strip())
+        if filled < 0.9 * len(records):
+            return False, f'{field} empty in {len(records) - filled} records'
+    return True, 'ok'
+
+
+def probe(site, session=None):
+    """
+    抓样例页, 试各静态档位
+    :param site: ROUTES里的站点名
+    :return: dict 缓存项
+    """
+    route = ROUTES[site]
+    own = session is None
+    session = session or make_requests_session(SITES[site][3])
+    url = route['sample']
+    entry = {'pattern': route['pattern'], 'sample': url, 'probed': time.time(),
+             'tier': 'browser', 'tiers': {}}
+    try:
+        t0 = time.perf_counter()
+        resp = session.get(url, timeout=15)
+        entry['fetch_ms'] = round((time.perf_counter() - t0) * 1000, 1)
+        entry['status'] = resp.status_code
+    except Exception as e:
+        logger.warning(f'[probe] {site}: plain HTTP failed ({e}), route to browser')
+        entry.update(reason=f'fetch failed: {e}', fetch_failed=True)
+        return entry
+    finally:
+        if own:
+            session.close()
+    if resp.status_code != 200:
+        entry.update(reason=f'HTTP {resp.status_code}', fetch_failed=True)
+        logger.warning(f'[probe] {site}: HTTP {resp.status_code}, route to browser')
+        return entry
+
+    charset = declared_charset(resp.headers.get('Content-Type'))
+    results = {}
+    for tier in TIERS:
+        if tier not in route['parsers']:
+            continue
+        parse, _ = PARSERS[route['parsers'][tier]]
+        t0 = time.perf_counter()
+        try:
+            records = parse(resp.content, url, charset)
+            ok, reason = check_records(records, route)
+        except Exception as e:
+            records, ok, reason = [], False, f'{type(e).__name__}: {e}'
+        results[tier] = records
+        entry['tiers'][tier] = {'ok': ok, 'reason': reason, 'records': len(records),
+                                'parse_ms': round((time.perf_counter() - t0) * 1000, 3)}
+
+    # 正则最脆, 两个都能用时要求和lxml结果一致才信它
+    if entry['tiers'].get('regex', {}).get('ok') and entry['tiers'].get('lxml', {}).get('ok') \
+            and results['regex'] != results['lxml']:
+        entry['tiers']['regex'].update(ok=False, reason='differs from lxml')
+
+    for tier in TIERS:
+        if entry['tiers'].get(tier, {}).get('ok'):
+            entry['tier'] = tier
+            break
+    else:
+        entry['reason'] = 'no static tier produced the expected records'
+    logger.info(f'[probe] {site} -> {entry["tier"]} {entry["tiers"]}')
+    return entry
+
+
+def choose_tier(site, refresh=False, max_age=CACHE_TTL, cache_file=CACHE_FILE):
+    """
+    取站点的渲染档位, 缓存过期/没有/refresh时重新探测
+    样例页没抓到的探测结果只管 RETRY_TTL
+    :return: 'regex' / 'lxml' / 'browser'
+    """
+    cache = load_cache(cache_file)
+    entry = cache.get(site)
+    ttl = min(max_age, RETRY_TTL) if entry and entry.get('fetch_failed') else max_age
+    if entry and not refresh and time.time() - entry['probed'] < ttl:
+        return entry['tier']
+    new = probe(site)
+    # 探测结果覆盖, 历史吞吐保留
+    new['throughput'] = (entry or {}).get('throughput', {})
+    cache[site] = new
+    save_cache(cache, cache_file)
+    return new['tier']
+
+
+def probe_reason(site, cache_file=CACHE_FILE):
+    """最近一次探测为什么没选静态档位, 没有就是None"""
+    return load_cache(cache_file).get(site, {}).get('reason')
+
+
+def route(url, refresh=False, cache_file=CACHE_FILE):
+    """按url模式找站点再取档位, 不认识的url只能交给浏览器"""
+    site = site_for_url(url)
+    return choose_tier(site, refresh, cache_file=cache_file) if site else 'browser'
+
+
+def crawl_static(site, urls, tier, session=None):
+    """
+    用普通HTTP + 静态档位的解析后端抓一批页面, 单页失败只记日志, 不影响其它页
+    :return: list[dict]
+    """
+    parse, _ = PARSERS[ROUTES[site]['parsers'][tier]]
+    own = session is None
+    session = session or make_requests_session(SITES[site][3])
+    records = []
+    failed = 0
+    try:
+        for url in urls:
+            try:
+                resp = session.get(url, timeout=10)
+                resp.raise_for_status()
+                page = parse(resp.content, url, declared_charset(resp.headers.get('Content-Type')))
+            except Exception as e:
+                logger.error(f'[{tier}] {url} failed: {e}')
+                failed += 1
+                continue
+            records.extend(page)
+            logger.info(f'[{tier}] {url}: {len(page)} records')
+    finally:
+        if own:
+            session.close()
+    if failed:
+        logger.warning(f'[{tier}] {failed}/{len(urls)} pages failed')
+    return records
+
+
+def record_throughput(site, tier, pages, records, elapsed, cache_file=CACHE_FILE):
+    """把一次实际爬取的吞吐记到缓存里, show的时候按档位对比"""
+    cache = load_cache(cache_file)
+    entry = cache.setdefault(site, {'tier': tier, 'probed': 0, 'tiers': {}})
+    entry.setdefault('throughput', {})[tier] = {
+        'pages': pages,
+        'records': records,
+        'elapsed_s': round(elapsed, 3),
+        'pages_per_s': round(pages / elapsed, 2) if elapsed > 0 else None,
+        'ts': time.time(),
+    }
+    save_cache(cache, cache_file)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='渲染层路由: 探测每个站点最便宜能用的档位')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    p_probe = sub.add_parser('probe', help='探测并缓存档位')
+    p_probe.add_argument('--site', action='append', choices=sorted(ROUTES))
+    p_probe.add_argument('--refresh', action='store_true', help='忽略缓存重新探测')
+    sub.add_parser('show', help='查看缓存的档位和各档位吞吐')
+    args = ap.parse_args()
+
+    if args.cmd == 'probe':
+        for site in args.site or sorted(ROUTES):
+            print(f'{site}: {choose_tier(site, args.refresh)}')
+        return
+
+    for site, entry in sorted(load_cache().items()):
+        probed = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['probed'])) if entry['probed'] else '-'
+        print(f'{site}: tier={entry["tier"]} (probed {probed})')
+        for tier, r in entry.get('tiers', {}).items():
+            print(f'  probe {tier:8s} ok={r["ok"]!s:5s} records={r["records"]:<4} '
+                  f'parse={r["parse_ms"]}ms  {r["reason"]}')
+        for tier, t in entry.get('throughput', {}).items():
+            print(f'  run   {tier:8s} {t["pages"]} pages / {t["records"]} records in {t["elapsed_s"]}s '
+                  f'-> {t["pages_per_s"]} pages/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+import argparse
+import bisect
+import csv
+import json
+import os
+import re
+import shlex
+import time
+from loguru import logger
+from sinks import atomic_write_bytes
+
+# 本地全文 + 字段索引
+# 爬完之后建一次索引, 以后"某导演拍了哪些Top250" / "5星且20镑以下的书"不用再扫csv:
+#   倒排索引: title / director / actors / quote, 中日韩文字按 单字+二元组 切, 英文按单词
+#   数值索引: rating / price / year / votes / rank, 排好序的数组, 区间查询走二分
+# 爬虫写完csv会顺手整个重建一次(和快照一样); 索引也支持增量 add / remove,
+# watch模式 --index 的变更流直接喂进同一个索引
+#
+# 用法:
+#   python scrape/search_index.py build data/douban_movies.csv       # 手动重建
+#   python scrape/search_index.py query douban_movies 'director:宫崎骏'
+#   python scrape/search_index.py query books_aiohttp 'rating>=5 price<20'
+#   python scrape/search_index.py query douban_movies '希望 year<2000'
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+INDEX_DIR = os.path.join(DATA_DIR, 'index')
+TEXT_FIELDS = ['title', 'director', 'actors', 'quote']
+NUMERIC_FIELDS = ['rating', 'price', 'year', 'votes', 'rank']
+# 假名 / CJK扩展A / 基本汉字 / 兼容汉字 / 韩文
+CJK = r'\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af'
+TOKEN_RE = re.compile(rf'[{CJK}]+|[0-9a-z]+(?:[\'.][0-9a-z]+)*')
+CJK_RE = re.compile(rf'[{CJK}]')
+COND_RE = re.compile(r'^(\w+)(>=|<=|>|<|=|:)(.+)$')
+
+
+def tokenize(text, query=False):
+    """
+    中日韩连续文字: 建索引时出单字+二元组, 查询时长度>=2只用二元组(更精确)
+    其它: 小写后按单词切
+    """
+    tokens = []
+    for m in TOKEN_RE.finditer(text.lower()):
+        s = m.group()
+        if CJK_RE.match(s):
+            bigrams = [s[i:i + 2] for i in range(len(s) - 1)]
+            if query:
+                tokens.extend(bigrams or [s])
+            else:
+                tokens.extend(s)
+                tokens.extend(bigrams)
+        else:
+            tokens.append(s)
+    return tokens
+
+
+def _number(value):
+    try:
+        return float(str(value).replace(',', ''))
+    except (TypeError, ValueError):
+        return None
+
+
+def record_key(record):
+    return record.get('url') or json.dumps(record, sort_keys=True, ensure_ascii=False)
+
+
+class SearchIndex(object):
+    """
+    docs: doc_id -> record (删掉的是None)
+    postings: field -> term -> set(doc_id)
+    numeric: field -> 按值排序的 [(value, doc_id)]
+    """
+
+    def __init__(self, fields=None):
+        self.fields = fields or []
+        self.docs = []
+        self.keys = {}
+        self.postings = {}
+        self.numeric = {}
+
+    def _text_fields(self):
+        return [f for f in TEXT_FIELDS if f in self.fields]
+
+    def _numeric_fields(self):
+        return [f for f in NUMERIC_FIELDS if f in self.fields]
+
+    def add(self, record):
+        """新增或更新一条记录(按url去重), 更新时沿用原来的doc_id"""
+        if not self.fields:
+            self.fields = list(record)
+        key = record_key(record)
+        doc_id = self.keys.get(key)
+        if doc_id is None:
+            doc_id = len(self.docs)
+            self.docs.append(record)
+            self.keys[key] = doc_id
+        else:
+            self._unindex(doc_id)
+            self.docs[doc_id] = record
+        self._index(doc_id, record)
+        return doc_id
+
+    def extend(self, records):
+        """
+        批量add, 结果和逐条add一样
+        新记录的数值先追加, 最后每个字段排一次序, 不用每条insort(大csv逐条insort是O(n^2))
+        """
+        fresh = {}
+        for record in records:
+            if not self.fields:
+                self.fields = list(record)
+            key = record_key(record)
+            if key in self.keys:
+                self.add(record)
+            else:
+                # 同一批里重复的key: 位置按第一次出现, 内容以最后一条为准
+                fresh[key] = record
+        for key, record in fresh.items():
+            doc_id = len(self.docs)
+            self.docs.append(record)
+            self.keys[key] = doc_id
+            self._index(doc_id, record, bulk=True)
+        for arr in self.numeric.values():
+            arr.sort()
+
+    def _index(self, doc_id, record, bulk=False):
+        for field in self._text_fields():
+            terms = self.postings.setdefault(field, {})
+            for tok in set(tokenize(record.get(field) or '')):
+                terms.setdefault(tok, set()).add(doc_id)
+        for field in self._numeric_fields():
+            value = _number(record.get(field))
+            if value is None:
+                continue
+            arr = self.numeric.setdefault(field, [])
+            if bulk:
+                arr.append((value, doc_id))
+            else:
+                bisect.insort(arr, (value, doc_id))
+
+    def _unindex(self, doc_id):
+        """把一条记录从倒排/数值索引里摘掉, docs本身不动"""
+        record = self.docs[doc_id]
+        for field in self._text_fields():
+            terms = self.postings.get(field, {})
+            for tok in set(tokenize(record.get(field) or '')):
+                ids = terms.get(tok)
+                if ids:
+                    ids.discard(doc_id)
+                    if not ids:
+                        del terms[tok]
+        for field in self._numeric_fields():
+            value = _number(record.get(field))
+            arr = self.numeric.get(field)
+            if value is not None and arr:
+                i = bisect.bisect_left(arr, (value, doc_id))
+                if i < len(arr) and arr[i] == (value, doc_id):
+                    del arr[i]
+
+    def remove(self, key):
+        doc_id = self.keys.pop(key, None)
+        if doc_id is None:
+            return False
+        self._unindex(doc_id)
+        self.docs[doc_id] = None
+        return True
+
+    def compact(self):
+        """去掉删除留下的空位, doc_id重新连续编号(新旧id单调对应, 数值索引的顺序不变)"""
+        if all(r is not None for r in self.docs):
+            return
+        remap = {}
+        docs = []
+        for old, record in enumerate(self.docs):
+            if record is not None:
+                remap[old] = len(docs)
+                docs.append(record)
+        self.docs = docs
+        self.keys = {key: remap[old] for key, old in self.keys.items()}
+        self.postings = {f: {t: {remap[i] for i in ids} for t, ids in terms.items()}
+                         for f, terms in self.postings.items()}
+        self.numeric = {f: [(v, remap[i]) for v, i in arr] for f, arr in self.numeric.items()}
+
+    def apply_change(self, event):
+        """吃watch模式的变更事件"""
+        if event['op'] == 'removed':
+            self.remove(event['key'])
+        else:
+            self.add(event['record'])
+
+    # ---------- 查询 ----------
+
+    def _text_match(self, fields, text):
+        tokens = tokenize(text, query=True)
+        if not tokens:
+            return set()
+        result = None
+        for tok in tokens:
+            ids = set()
+            for field in fields:
+                ids |= self.postings.get(field, {}).get(tok, set())
+            result = ids if result is None else result & ids
+            if not result:
+                return set()
+        # 二元组命中不等于连续命中, 最后用原文确认一下
+        needle = text.lower()
+        return {i for i in result
+                if any(needle in (self.docs[i].get(f) or '').lower() for f in fields)}
+
+    def _range(self, field, op, value):
+        arr = self.numeric.get(field, [])
+        inf = float('inf')
+        if op == '>=':
+            lo, hi = bisect.bisect_left(arr, (value, -1)), len(arr)
+        elif op == '>':
+            lo, hi = bisect.bisect_right(arr, (value, inf)), len(arr)
+        elif op == '<=':
+            lo, hi = 0, bisect.bisect_right(arr, (value, inf))
+        elif op == '<':
+            lo, hi = 0, bisect.bisect_left(arr, (value, -1))
+        else:
+            lo, hi = bisect.bisect_left(arr, (value, -1)), bisect.bisect_right(arr, (value, inf))
+        return {doc_id for _, doc_id in arr[lo:hi]}
+
+    def query(self, q):
+        """
+        条件之间是AND:
+          director:宫崎骏      字段全文
+          rating>=9 price<20  数值区间(> >= < <= =)
+          希望                所有文本字段全文
+        :return: list[dict], 按入库顺序
+        """
+        result = None
+        for part in shlex.split(q):
+            m = COND_RE.match(part)
+            if m and m.group(2) != ':' and m.group(1) in self.numeric:
+                value = _number(m.group(3))
+                ids = self._range(m.group(1), m.group(2), value) if value is not None else set()
+            elif m and m.group(2) == ':' and m.group(1) in self._text_fields():
+                ids = self._text_match([m.group(1)], m.group(3))
+            else:
+                ids = self._text_match(self._text_fields(), part)
+            result = ids if result is None else result & ids
+            if not result:
+                return []
+        return [self.docs[i] for i in sorted(result or [])]
+
+    # ---------- 持久化 ----------
+
+    def to_dict(self):
+        return {
+            'fields': self.fields,
+            'docs': self.docs,
+            'postings': {f: {t: sorted(ids) for t, ids in terms.items()}
+                         for f, terms in self.postings.items()},
+            'numeric': self.numeric,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        idx = cls(data['fields'])
+        idx.docs = data['docs']
+        idx.keys = {record_key(r): i for i, r in enumerate(idx.docs) if r is not None}
+        idx.postings = {f: {t: set(ids) for t, ids in terms.items()}
+                        for f, terms in data['postings'].items()}
+        idx.numeric = {f: [tuple(x) for x in arr] for f, arr in data['numeric'].items()}
+        return idx
+
+    def save(self, filepath):
+        self.compact()
+        os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+        data = json.dumps(self.to_dict(), ensure_ascii=False, separators=(',', ':'))
+        atomic_write_bytes(filepath, data.encode('utf-8'))
+
+    @classmethod
+    def load(cls, filepath):
+        with open(filepath, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+def index_path(dataset):
+    return os.path.join(INDEX_DIR, f'{dataset}.json')
+
+
+def csv_dataset(csv_path):
+    """data/douban_movies.csv -> douban_movies"""
+    return os.path.splitext(os.path.basename(csv_path))[0]
+
+
+def open_index(dataset, csv_path=None):
+    """有就加载; 没有但有csv就从csv建; 都没有就建个空的"""
+    path = index_path(dataset)
+    if os.path.exists(path):
+        return SearchIndex.load(path)
+    if csv_path and os.path.exists(csv_path):
+        return build_from_csv(csv_path, dataset)
+    return SearchIndex()
+
+
+def build_index(records, dataset, fields=None):
+    """
+    用一批记录整个重建索引, 覆盖旧索引(已经没有的记录不会残留)
+    增量更新走 add / remove / apply_change
+    """
+    idx = SearchIndex(list(fields or []))
+    idx.extend(records)
+    idx.save(index_path(dataset))
+    logger.info(f'indexed {len(idx.docs)} records -> {index_path(dataset)}')
+    return idx
+
+
+def build_from_csv(csv_path, dataset=None):
+    with open(csv_path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        return build_index(reader, dataset or csv_dataset(csv_path), reader.fieldnames)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='本地全文/字段索引')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    p_build = sub.add_parser('build', help='从csv重建索引(覆盖已有索引)')
+    p_build.add_argument('csv', nargs='+')
+    p_q = sub.add_parser('query', help='查询')
+    p_q.add_argument('dataset', help='如 douban_movies / books_aiohttp')
+    p_q.add_argument('q', help="如 'director:宫崎骏 rating>=8.5'")
+    p_q.add_argument('--limit', type=int, default=20)
+    args = ap.parse_args()
+
+    if args.cmd == 'build':
+        for path in args.csv:
+            build_from_csv(path)
+        return
+
+    idx = SearchIndex.load(index_path(args.dataset))
+    t0 = time.perf_counter()
+    rows = idx.query(args.q)
+    elapsed = time.perf_counter() - t0
+    for r in rows[:args.limit]:
+        print(json.dumps(r, ensure_ascii=False))
+    logger.info(f'{len(rows)} hits in {elapsed * 1000:.3f}ms')
+
+
+if __name__ == '__main__':
+    main()
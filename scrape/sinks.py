@@ -0,0 +1,317 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import time
+import uuid
+from loguru import logger
+
+# 分区 + 压缩 + 原子发布的输出
+# 不再每次覆盖同一个大csv, 而是按 日期/run 分区写成大小有上限的压缩分块:
+#   data/<dataset>/date=2026-10-19/run=20261019-101500-ab12cd/part-00000.csv.gz
+# 每个分块先写临时名, fsync后rename到正式名, 再更新manifest.json,
+# 下游只看manifest, 永远读不到写了一半的文件, 也可以只读新分区、并行读
+# manifest里每个run有状态 open / complete / aborted, close()之后才是complete,
+# 下游默认只读complete的run, 中途失败的run不会被读到一半
+#
+# 用法:
+#   python scrape/books_aiohttp.py --partitioned --codec zstd
+#   python scrape/sinks.py ls books_aiohttp
+#   python scrape/sinks.py cat books_aiohttp --since 2026-10-01
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+MAX_ROWS = 50000
+MAX_BYTES = 64 * 1024 * 1024    # 未压缩字节数上限
+CODEC_EXT = {'gzip': '.csv.gz', 'zstd': '.csv.zst', 'none': '.csv'}
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+try:
+    import fcntl
+except ImportError:
+    # Windows上没有fcntl, manifest锁退化成不加锁
+    fcntl = None
+
+
+def fsync_dir(path):
+    """rename之后fsync目录, 保证新文件名本身也落盘(Windows上不支持, 跳过)"""
+    if os.name != 'posix':
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write(filepath, write, mode='wb', **open_kwargs):
+    """
+    写临时文件 -> fsync -> rename -> fsync目录, 读的人要么看到旧文件要么看到新文件
+    临时名带随机后缀, 同一个脚本同时跑两份也不会互相覆盖; 出错时删掉临时文件
+    :param write: write(f), 往打开的临时文件里写内容
+    """
+    tmp = f'{filepath}.{uuid.uuid4().hex[:8]}.tmp'
+    try:
+        with open(tmp, mode, **open_kwargs) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, filepath)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    fsync_dir(os.path.dirname(os.path.abspath(filepath)))
+
+
+def atomic_write_bytes(filepath, data):
+    atomic_write(filepath, lambda f: f.write(data))
+
+
+def atomic_write_csv(records, filepath, fields):
+    """
+    爬虫脚本的 save_csv 共用: 整个csv原子替换(utf-8-sig, Excel直接打开不乱码)
+    :param records: list[dict]
+    :param filepath: csv路径
+    :param fields: 列顺序
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+
+    def write(f):
+        w = csv.DictWriter(f, fieldnames=fields)
+        w.writeheader()
+        w.writerows(records)
+    atomic_write(filepath, write, 'w', newline='', encoding='utf-8-sig')
+
+
+def _open_codec(raw, codec):
+    """在原始文件对象外面包一层压缩"""
+    if codec == 'gzip':
+        return gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6)
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=6).stream_writer(raw, closefd=False)
+    return None
+
+
+def open_partition(filepath):
+    """按扩展名解压, 返回文本流"""
+    if filepath.endswith('.gz'):
+        return gzip.open(filepath, 'rt', encoding='utf-8', newline='')
+    if filepath.endswith('.zst'):
+        if not HAS_ZSTD:
+            raise ImportError('zstandard not installed')
+        raw = open(filepath, 'rb')
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw, closefd=True),
+                                encoding='utf-8', newline='')
+    return open(filepath, encoding='utf-8', newline='')
+
+
+class PartitionedSink(object):
+    """
+    流式写分区数据集
+    sink = PartitionedSink('books_aiohttp', fields)
+    sink.write_many(books); sink.close()
+    """
+
+    def __init__(self, dataset, fields, root=DATA_DIR, codec='gzip', max_rows=MAX_ROWS,
+                 max_bytes=MAX_BYTES, run_id=None, date=None):
+        if codec == 'zstd' and not HAS_ZSTD:
+            logger.warning('zstandard未安装, 改用gzip (pip install zstandard)')
+            codec = 'gzip'
+        self.dataset = dataset
+        self.fields = fields
+        self.codec = codec
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.date = date or time.strftime('%Y-%m-%d')
+        self.run_id = run_id or f'{time.strftime("%Y%m%d-%H%M%S")}-{uuid.uuid4().hex[:6]}'
+        self.dataset_dir = os.path.join(root, dataset)
+        self.run_dir = os.path.join(self.dataset_dir, f'date={self.date}', f'run={self.run_id}')
+        self.published = []
+        self.rows = 0
+        self._part = 0
+        self._raw = None
+
+    def _start_chunk(self):
+        os.makedirs(self.run_dir, exist_ok=True)
+        name = f'part-{self._part:05d}{CODEC_EXT[self.codec]}'
+        self._final = os.path.join(self.run_dir, name)
+        self._tmp = os.path.join(self.run_dir, f'.{name}.tmp')
+        self._raw = open(self._tmp, 'wb')
+        self._comp = _open_codec(self._raw, self.codec)
+        self._text = io.TextIOWrapper(self._comp or self._raw, encoding='utf-8', newline='',
+                                      write_through=True)
+        self._writer = csv.DictWriter(self._text, fieldnames=self.fields, extrasaction='ignore')
+        self._writer.writeheader()
+        self._chunk_rows = 0
+        self._chunk_bytes = 0
+
+    def _finish_chunk(self):
+        """flush -> fsync -> rename -> 登记到manifest"""
+        self._text.flush()
+        self._text.detach()
+        if self._comp is not None:
+            self._comp.close()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        size = self._raw.tell()
+        self._raw.close()
+        self._raw = None
+        os.replace(self._tmp, self._final)
+        fsync_dir(self.run_dir)
+
+        entry = {
+            'path': os.path.relpath(self._final, self.dataset_dir).replace(os.sep, '/'),
+            'date': self.date,
+            'run': self.run_id,
+            'rows': self._chunk_rows,
+            'bytes': size,
+            'codec': self.codec,
+            'created': time.time(),
+        }
+        self.published.append(entry)
+        update_manifest(self.dataset_dir, self.fields, [entry], self.run_id, 'open')
+        self._part += 1
+
+    def write(self, record):
+        if self._raw is None:
+            self._start_chunk()
+        self._writer.writerow(record)
+        self._chunk_rows += 1
+        self.rows += 1
+        # 粗略按字段长度估算未压缩大小, 不用每行去问压缩器
+        self._chunk_bytes += sum(len(str(v)) for v in record.values()) + len(record)
+        if self._chunk_rows >= self.max_rows or self._chunk_bytes >= self.max_bytes:
+            self._finish_chunk()
+
+    def write_many(self, records):
+        for rec in records:
+            self.write(rec)
+
+    def close(self):
+        """发布最后一个分块, 再把run标成complete, 下游这时才看得到这个run"""
+        if self._raw is not None:
+            self._finish_chunk()
+        update_manifest(self.dataset_dir, self.fields, [], self.run_id, 'complete')
+        logger.info(f'published {self.rows} rows in {len(self.published)} partitions -> {self.run_dir}')
+
+    def abort(self):
+        """出错时丢掉没写完的分块; 已发布的分块留在磁盘上, 但run标成aborted, 下游默认不读"""
+        if self._raw is not None:
+            self._text.detach()
+            self._raw.close()
+            self._raw = None
+            os.remove(self._tmp)
+        if self.published:
+            update_manifest(self.dataset_dir, self.fields, [], self.run_id, 'aborted')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def read_manifest(dataset_dir):
+    path = os.path.join(dataset_dir, 'manifest.json')
+    if not os.path.exists(path):
+        return {'partitions': []}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def update_manifest(dataset_dir, fields, entries, run=None, status=None):
+    """
+    加锁读-改-写manifest, 同一数据集多个run同时写也不会丢分区
+    :param entries: 新发布的分区
+    :param run: run_id, 和status一起更新这个run的状态(open / complete / aborted)
+    """
+    os.makedirs(dataset_dir, exist_ok=True)
+    lock = open(os.path.join(dataset_dir, '.manifest.lock'), 'w')
+    try:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        manifest = read_manifest(dataset_dir)
+        manifest['dataset'] = os.path.basename(dataset_dir)
+        manifest['fields'] = fields
+        manifest['partitions'] = manifest.get('partitions', []) + entries
+        if run is not None:
+            manifest.setdefault('runs', {})[run] = {'status': status, 'updated': time.time()}
+        manifest['updated'] = time.time()
+        data = json.dumps(manifest, ensure_ascii=False, indent=1).encode('utf-8')
+        atomic_write_bytes(os.path.join(dataset_dir, 'manifest.json'), data)
+    finally:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+        lock.close()
+
+
+def new_partitions(dataset, seen=(), since=None, root=DATA_DIR, incomplete=False):
+    """
+    下游增量读取: 跳过已经处理过的分区
+    :param seen: 已处理的分区path集合
+    :param since: 只要这个日期(YYYY-MM-DD)及之后的
+    :param incomplete: 也返回还在写 / 中途失败的run的分区
+    :return: list[manifest entry], 带绝对路径 abspath
+    """
+    dataset_dir = os.path.join(root, dataset)
+    manifest = read_manifest(dataset_dir)
+    # 没有状态记录的run是加状态之前写的, 当作complete
+    runs = manifest.get('runs', {})
+    out = []
+    for entry in manifest['partitions']:
+        if entry['path'] in seen or (since and entry['date'] < since):
+            continue
+        if not incomplete and runs.get(entry['run'], {}).get('status', 'complete') != 'complete':
+            continue
+        out.append(dict(entry, abspath=os.path.join(dataset_dir, entry['path'])))
+    return out
+
+
+def write_partitioned(records, dataset, fields, codec='gzip', max_rows=MAX_ROWS):
+    """爬虫脚本用的一次性写入"""
+    with PartitionedSink(dataset, fields, codec=codec, max_rows=max_rows) as sink:
+        sink.write_many(records)
+    return sink.published
+
+
+def main():
+    ap = argparse.ArgumentParser(description='分区数据集工具')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    p_ls = sub.add_parser('ls', help='列出分区')
+    p_ls.add_argument('dataset')
+    p_ls.add_argument('--since', help='YYYY-MM-DD')
+    p_ls.add_argument('--all', action='store_true', help='也列出没写完 / 中途失败的run')
+    p_cat = sub.add_parser('cat', help='把分区内容按csv输出到stdout')
+    p_cat.add_argument('dataset')
+    p_cat.add_argument('--since', help='YYYY-MM-DD')
+    args = ap.parse_args()
+
+    parts = new_partitions(args.dataset, since=args.since, incomplete=args.cmd == 'ls' and args.all)
+    if args.cmd == 'ls':
+        for p in parts:
+            print(f"{p['rows']:>8} rows {p['bytes']:>10} B  {p['codec']:5s} {p['path']}")
+        return
+
+    writer = None
+    for p in parts:
+        with open_partition(p['abspath']) as f:
+            reader = csv.DictReader(f)
+            if writer is None:
+                writer = csv.DictWriter(sys.stdout, fieldnames=reader.fieldnames)
+                writer.writeheader()
+            writer.writerows(reader)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+import argparse
+import csv
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from loguru import logger
+from sinks import atomic_write
+
+# 二进制列存快照, 给分析/diff任务秒开用
+# csv每次都要逐行解析(还要处理utf-8-sig的BOM), 数据一多就慢。快照写在csv旁边(.snap):
+#   数值列(rank / year / votes / rating / price) -> 定长小端数组
+#   文本列 -> uint64偏移数组 + utf-8字符串堆
+# 读的时候mmap整个文件, 数值列直接是NumPy零拷贝视图(没装numpy就是memoryview)
+#
+# 文件布局(小端, 每段按8字节对齐):
+#   magic 'WOCSNAP1' | u32 版本 | u32 目录长度 | u64 行数 | 目录(json) | 各列数据
+#
+# 用法:
+#   python scrape/snapshot.py build data/douban_movies.csv data/books_aiohttp.csv
+#   python scrape/snapshot.py info data/douban_movies.snap
+
+MAGIC = b'WOCSNAP1'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQ')
+# 数值列的类型, 其余一律按字符串存
+NUMERIC = {'rank': 'i4', 'year': 'i4', 'votes': 'i8', 'rating': 'f8', 'price': 'f8'}
+INT_NA = -1         # 缺失的整数, 超出范围的也算缺失
+INT_LIMIT = {'i4': 2 ** 31, 'i8': 2 ** 63}
+ARRAY_CODE = {'i4': 'i', 'i8': 'q', 'f8': 'd', 'u8': 'Q'}
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+
+def snapshot_path(csv_path):
+    """data/xxx.csv -> data/xxx.snap"""
+    return os.path.splitext(csv_path)[0] + '.snap'
+
+
+def _pad(n):
+    return (-n) % 8
+
+
+def _to_number(value, kind):
+    value = str(value).strip().replace(',', '') if value is not None else ''
+    if kind == 'f8':
+        try:
+            return float(value)
+        except ValueError:
+            return math.nan
+    try:
+        # 'inf'转int是OverflowError, 'nan'是ValueError
+        number = int(float(value))
+    except (ValueError, OverflowError):
+        return INT_NA
+    return number if -INT_LIMIT[kind] <= number < INT_LIMIT[kind] else INT_NA
+
+
+def _le_bytes(data):
+    """array按本机字节序存, 文件里一律小端"""
+    if sys.byteorder == 'big':
+        data.byteswap()
+    return data.tobytes()
+
+
+def _column_blocks(records, field):
+    """:return: (目录项, [bytes块])"""
+    kind = NUMERIC.get(field)
+    if kind:
+        data = array(ARRAY_CODE[kind], (_to_number(r.get(field), kind) for r in records))
+        return {'name': field, 'type': kind}, [_le_bytes(data)]
+
+    offsets = array('Q', [0])
+    heap = []
+    pos = 0
+    for r in records:
+        value = r.get(field)
+        b = ('' if value is None else str(value)).encode('utf-8')
+        heap.append(b)
+        pos += len(b)
+        offsets.append(pos)
+    return {'name': field, 'type': 'str'}, [_le_bytes(offsets), b''.join(heap)]
+
+
+def write_snapshot(records, filepath, fields):
+    """
+    写快照, 走 sinks.atomic_write 原子替换
+    :param records: list[dict]
+    :param filepath: .snap路径
+    :param fields: 列顺序
+    """
+    columns = [_column_blocks(records, field) for field in fields]
+    directory = [dict(entry, lengths=[len(p) for p in parts]) for entry, parts in columns]
+
+    # 目录里记每段的绝对偏移, 偏移又取决于目录本身的长度, 算到长度不再变化为止
+    dir_bytes = b''
+    while True:
+        pos = HEADER.size + len(dir_bytes) + _pad(HEADER.size + len(dir_bytes))
+        for entry in directory:
+            entry['offsets'] = []
+            for length in entry['lengths']:
+                entry['offsets'].append(pos)
+                pos += length + _pad(length)
+        new_bytes = json.dumps({'columns': directory}, ensure_ascii=False).encode('utf-8')
+        done = len(new_bytes) == len(dir_bytes)
+        # 长度没变时偏移也已经是对的, 但要用这一轮的目录(上一轮的偏移是按旧长度算的)
+        dir_bytes = new_bytes
+        if done:
+            break
+
+    def write(f):
+        f.write(HEADER.pack(MAGIC, VERSION, len(dir_bytes), len(records)))
+        f.write(dir_bytes)
+        f.write(b'\0' * _pad(HEADER.size + len(dir_bytes)))
+        for entry, (_, parts) in zip(directory, columns):
+            for off, part in zip(entry['offsets'], parts):
+                assert f.tell() == off
+                f.write(part)
+                f.write(b'\0' * _pad(len(part)))
+
+    os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+    atomic_write(filepath, write)
+    logger.info(f'snapshot {len(records)} rows x {len(fields)} cols -> {filepath}')
+
+
+class Snapshot(object):
+    """
+    mmap打开快照, 不读进内存
+    snap = Snapshot('data/douban_movies.snap')
+    snap.column('rating')      # numpy零拷贝视图 / memoryview
+    snap.strings('title')      # list[str], 按需解码
+    snap.row(0)                # dict
+    用完numpy视图再close, 否则mmap关不掉
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self._f = open(filepath, 'rb')
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, dir_len, self.n_rows = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{filepath}: not a snapshot file')
+        if version != VERSION:
+            raise ValueError(f'{filepath}: unsupported snapshot version {version}')
+        directory = json.loads(bytes(self._mm[HEADER.size:HEADER.size + dir_len]))
+        self._columns = {c['name']: c for c in directory['columns']}
+        self.fields = [c['name'] for c in directory['columns']]
+
+    def __len__(self):
+        return self.n_rows
+
+    def _view(self, kind, offset, count):
+        if HAS_NUMPY:
+            return np.frombuffer(self._mm, dtype='<' + kind, count=count, offset=offset)
+        size = struct.calcsize(ARRAY_CODE[kind])
+        return memoryview(self._mm)[offset:offset + count * size].cast(ARRAY_CODE[kind])
+
+    def column(self, name):
+        """数值列: 零拷贝视图; 整数缺失为-1, 浮点缺失为NaN"""
+        col = self._columns[name]
+        if col['type'] == 'str':
+            raise TypeError(f'{name} is a string column, use strings()')
+        return self._view(col['type'], col['offsets'][0], self.n_rows)
+
+    def _str_parts(self, name):
+        col = self._columns[name]
+        if col['type'] != 'str':
+            raise TypeError(f'{name} is a numeric column, use column()')
+        offsets = self._view('u8', col['offsets'][0], self.n_rows + 1)
+        return offsets, col['offsets'][1]
+
+    def string(self, name, i):
+        offsets, heap = self._str_parts(name)
+        return self._mm[heap + int(offsets[i]):heap + int(offsets[i + 1])].decode('utf-8')
+
+    def strings(self, name):
+        offsets, heap = self._str_parts(name)
+        data = self._mm[heap:heap + int(offsets[self.n_rows])]
+        offs = offsets.tolist()
+        return [data[offs[i]:offs[i + 1]].decode('utf-8') for i in range(self.n_rows)]
+
+    def row(self, i):
+        out = {}
+        for name in self.fields:
+            if self._columns[name]['type'] == 'str':
+                out[name] = self.string(name, i)
+            else:
+                out[name] = self.column(name)[i].item() if HAS_NUMPY else self.column(name)[i]
+        return out
+
+    def close(self):
+        try:
+            self._mm.close()
+        except BufferError:
+            # 外面还拿着numpy视图, 交给GC
+            pass
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def csv_to_snapshot(csv_path, snap_path=None):
+    """把已有的csv转成快照"""
+    with open(csv_path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        records = list(reader)
+        fields = reader.fieldnames or []
+    snap_path = snap_path or snapshot_path(csv_path)
+    write_snapshot(records, snap_path, fields)
+    return snap_path
+
+
+def main():
+    ap = argparse.ArgumentParser(description='二进制列存快照')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    p_build = sub.add_parser('build', help='csv -> .snap')
+    p_build.add_argument('csv', nargs='+')
+    p_info = sub.add_parser('info', help='查看快照')
+    p_info.add_argument('snap')
+    p_info.add_argument('--head', type=int, default=3)
+    args = ap.parse_args()
+
+    if args.cmd == 'build':
+        for path in args.csv:
+            csv_to_snapshot(path)
+        return
+
+    t0 = time.perf_counter()
+    with Snapshot(args.snap) as snap:
+        opened = time.perf_counter() - t0
+        print(f'{args.snap}: {len(snap)} rows, opened in {opened * 1000:.2f}ms')
+        for name in snap.fields:
+            print(f"  {name:10s} {snap._columns[name]['type']}")
+        for i in range(min(args.head, len(snap))):
+            print(' ', snap.row(i))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+import aiohttp
+from loguru import logger
+from archive import PARSERS
+from frontier import SITES
+from http_client import make_session, new_event_loop
+from search_index import open_index, index_path
+
+# 常驻监控模式
+# 不再用cron定时全量重爬: 进程常驻, session一直保持,
+# 每个页面按自己的变化频率调度 —— 变了就缩短间隔, 没变就拉长,
+# 输出的是变更流(added / removed / updated), 不是全量快照
+#
+# 用法:
+#   python scrape/watch.py --site douban --site books
+#   tail -f data/changes_douban.jsonl
+#   python scrape/watch.py --site douban --index    # 变更同时写进爬虫那份索引 data/index/douban_movies.json
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+STATE_FILE = os.path.join(DATA_DIR, 'watch_state.json')
+CONCURRENCY = 3
+MIN_INTERVAL = 300          # 5分钟
+MAX_INTERVAL = 7 * 86400    # 一周
+INITIAL_INTERVAL = 3600
+SPEEDUP = 0.5               # 变了: 间隔减半
+BACKOFF = 1.5               # 没变: 间隔x1.5
+# --index 更新的是哪个爬虫数据集的索引(解析后端和这个爬虫一样), 索引还没有就先从它的csv建
+INDEX_DATASETS = {'douban': 'douban_movies', 'books': 'books_requests'}
+
+
+def record_digest(record):
+    return hashlib.sha1(json.dumps(record, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class Watcher(object):
+    """
+    调度 + 变更检测
+    state按url存: interval / next_at / etag / last_modified / 当前页上的记录key
+    记录本身按site存: key(记录的url) -> {page, digest, record[, missing]}
+    missing: 记录从归属页消失后, 已经抓过且没有它的页面; 覆盖整个站点才发removed
+    """
+
+    def __init__(self, sites, state_file=STATE_FILE, min_interval=MIN_INTERVAL,
+                 max_interval=MAX_INTERVAL, on_change=None):
+        self.state_file = state_file
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        # on_change(site, event) 给下游用的钩子，比如增量更新索引
+        self.on_change = on_change
+        self.sites = set(sites)
+        self.pages = {}
+        self.records = {}
+        self._load()
+        now = time.time()
+        for site in sites:
+            self.records.setdefault(site, {})
+            for url in SITES[site][1]:
+                self.pages.setdefault(url, {
+                    'site': site, 'interval': INITIAL_INTERVAL, 'next_at': now,
+                    'etag': None, 'last_modified': None, 'keys': [],
+                    'checks': 0, 'changes': 0,
+                })
+
+    def _load(self):
+        if os.path.exists(self.state_file):
+            with open(self.state_file, encoding='utf-8') as f:
+                state = json.load(f)
+            self.pages = state.get('pages', {})
+            self.records = state.get('records', {})
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        tmp = self.state_file + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'pages': self.pages, 'records': self.records}, f, ensure_ascii=False)
+        os.replace(tmp, self.state_file)
+
+    def due(self, now):
+        return [url for url, p in self.pages.items()
+                if p['site'] in self.sites and p['next_at'] <= now]
+
+    def next_wakeup(self):
+        return min((p['next_at'] for p in self.pages.values() if p['site'] in self.sites),
+                   default=time.time() + self.min_interval)
+
+    def site_pages(self, site):
+        return {url for url, p in self.pages.items() if p['site'] == site}
+
+    def apply(self, url, records):
+        """
+        用新抓到的记录和上次比较, 生成变更事件并调整调度间隔
+        :param records: 本页解析结果, None表示304没变
+        :return: list[dict] 变更事件
+        """
+        page = self.pages[url]
+        site = page['site']
+        known = self.records[site]
+        now = time.time()
+        events = []
+
+        if records is not None:
+            seen = []
+            for rec in records:
+                key = rec.get('url') or json.dumps(rec, sort_keys=True, ensure_ascii=False)
+                digest = record_digest(rec)
+                seen.append(key)
+                old = known.get(key)
+                if old is None:
+                    events.append({'op': 'added', 'key': key, 'record': rec})
+                elif old['digest'] != digest:
+                    events.append({'op': 'updated', 'key': key, 'record': rec, 'before': old['record']})
+                known[key] = {'page': url, 'digest': digest, 'record': rec}
+
+            seen_set = set(seen)
+            for key in page['keys']:
+                # 从归属页上消失的先记成missing, 可能只是排名变了挪到了别的页, 不急着删
+                if key not in seen_set and key in known and known[key]['page'] == url:
+                    known[key].setdefault('missing', [])
+            page['keys'] = seen
+
+        # missing的记录: 这一页(新抓的或304沿用的)上有就是挪过来了, 没有就记下这一页已经查过,
+        # 站点的每一页都查过还没有才算真的删除
+        present = set(page['keys'])
+        site_pages = self.site_pages(site)
+        for key, entry in list(known.items()):
+            if 'missing' not in entry:
+                continue
+            if key in present:
+                del entry['missing']
+                entry['page'] = url
+                continue
+            if url not in entry['missing']:
+                entry['missing'].append(url)
+            if site_pages <= set(entry['missing']):
+                events.append({'op': 'removed', 'key': key, 'record': known.pop(key)['record']})
+
+        page['checks'] += 1
+        if events:
+            page['changes'] += 1
+            page['interval'] = max(self.min_interval, page['interval'] * SPEEDUP)
+        else:
+            page['interval'] = min(self.max_interval, page['interval'] * BACKOFF)
+        page['next_at'] = now + page['interval']
+
+        for ev in events:
+            ev['ts'] = now
+            ev['site'] = site
+            ev['page'] = url
+            if self.on_change:
+                self.on_change(site, ev)
+        return events
+
+
+async def poll(session, watcher, url, sem):
+    """
+    抓一个页面, 带上 ETag / Last-Modified, 304就不用下载和解析
+    :return: list[dict] 或 None(没变)
+    """
+    page = watcher.pages[url]
+    parser_name, _, _, headers = SITES[page['site']]
+    headers = dict(headers)
+    if page['etag']:
+        headers['If-None-Match'] = page['etag']
+    if page['last_modified']:
+        headers['If-Modified-Since'] = page['last_modified']
+
+    async with sem:
+        async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=10)) as resp:
+            if resp.status == 304:
+                return None
+            resp.raise_for_status()
+            page['etag'] = resp.headers.get('ETag')
+            page['last_modified'] = resp.headers.get('Last-Modified')
+            body = await resp.read()
+            charset = resp.charset
+    return PARSERS[parser_name][0](body, url, charset)
+
+
+def append_feed(site, events):
+    path = os.path.join(DATA_DIR, f'changes_{site}.jsonl')
+    with open(path, 'a', encoding='utf-8') as f:
+        for ev in events:
+            f.write(json.dumps(ev, ensure_ascii=False) + '\n')
+
+
+async def run(watcher, once=False, indexes=None):
+    """
+    主循环: 取到期的页面并发抓 -> diff -> 写变更流 -> 睡到下一个到期时间
+    :param once: 只跑一轮(调试/cron兼容)
+    :param indexes: {site: SearchIndex}, 有变更的那一轮结束后落盘到 INDEX_DATASETS 对应的索引
+    """
+    sem = asyncio.Semaphore(CONCURRENCY)
+    # session全程复用，连接一直是热的
+    async with make_session(limit_per_host=CONCURRENCY) as session:
+        while True:
+            urls = watcher.due(time.time())
+            results = await asyncio.gather(*[poll(session, watcher, u, sem) for u in urls],
+                                           return_exceptions=True)
+            changed = set()
+            for url, res in zip(urls, results):
+                page = watcher.pages[url]
+                if isinstance(res, Exception):
+                    logger.error(f'{url} failed: {res}')
+                    # 失败不算变化，稍后重试
+                    page['next_at'] = time.time() + watcher.min_interval
+                    continue
+                events = watcher.apply(url, res)
+                if events:
+                    append_feed(page['site'], events)
+                    changed.add(page['site'])
+                logger.info(f'{url}: {len(events)} changes, next in {page["interval"] / 60:.0f}min')
+            watcher.save()
+            for site in changed & set(indexes or {}):
+                indexes[site].save(index_path(INDEX_DATASETS[site]))
+
+            if once:
+                break
+            await asyncio.sleep(max(1.0, watcher.next_wakeup() - time.time()))
+
+
+def main():
+    ap = argparse.ArgumentParser(description='常驻监控: 按变化频率自适应重爬, 输出变更流')
+    ap.add_argument('--site', action='append', choices=sorted(SITES), required=True)
+    ap.add_argument('--state', default=STATE_FILE, help='调度状态文件')
+    ap.add_argument('--min-interval', type=float, default=MIN_INTERVAL, help='最短重爬间隔(秒)')
+    ap.add_argument('--max-interval', type=float, default=MAX_INTERVAL, help='最长重爬间隔(秒)')
+    ap.add_argument('--once', action='store_true', help='只跑一轮就退出')
+    ap.add_argument('--index', action='store_true',
+                    help='变更事件增量写进爬虫数据集的搜索索引(douban_movies / books_requests)')
+    args = ap.parse_args()
+
+    indexes = None
+    if args.index:
+        indexes = {site: open_index(INDEX_DATASETS[site], os.path.join(DATA_DIR, f'{INDEX_DATASETS[site]}.csv'))
+                   for site in args.site}
+    on_change = (lambda site, ev: indexes[site].apply_change(ev)) if indexes else None
+    watcher = Watcher(args.site, args.state, args.min_interval, args.max_interval, on_change)
+    logger.info(f'watch模式启动: {len(watcher.due(float("inf")))} 个页面')
+    loop = new_event_loop()
+    try:
+        loop.run_until_complete(run(watcher, args.once, indexes))
+    except KeyboardInterrupt:
+        logger.info('收到中断, 保存状态退出')
+    finally:
+        watcher.save()
+        loop.close()
+
+
+if __name__ == '__main__':
+    main()
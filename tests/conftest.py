@@ -0,0 +1,5 @@
+import os
+import sys
+
+# scrape/ 下的脚本互相按同级模块import, 测试时把目录加进path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scrape'))
@@ -0,0 +1,87 @@
+import asyncio
+import hashlib
+import os
+
+from aiohttp import web
+
+import assets
+
+IMAGE = os.urandom(200 * 1024)
+ETAG = '"v1"'
+
+
+async def image(request):
+    if request.headers.get('If-None-Match') == ETAG:
+        return web.Response(status=304)
+    return web.Response(body=IMAGE, content_type='image/jpeg', headers={'ETag': ETAG})
+
+
+async def always_304(request):
+    return web.Response(status=304)
+
+
+async def run_server(handler_map, coro_fn):
+    app = web.Application()
+    for path, handler in handler_map.items():
+        app.router.add_get(path, handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    try:
+        return await coro_fn(f'http://127.0.0.1:{port}')
+    finally:
+        await runner.cleanup()
+
+
+def test_download_dedup_and_conditional(tmp_path):
+    index_file = str(tmp_path / 'index.json')
+
+    async def scenario(base):
+        urls = [f'{base}/a.jpg', f'{base}/b.jpg']
+        first = await assets.download_assets(urls, index_file=index_file,
+                                              bandwidth=None, rate=None, root=str(tmp_path))
+        second = await assets.download_assets(urls, index_file=index_file,
+                                              bandwidth=None, rate=None, root=str(tmp_path))
+        return first, second
+
+    first, second = asyncio.run(run_server({'/a.jpg': image, '/b.jpg': image}, scenario))
+    assert (first['new'], first['dup'], first['bytes']) == (1, 1, 2 * len(IMAGE))
+    assert (second['unchanged'], second['bytes']) == (2, 0)
+
+    sha = hashlib.sha256(IMAGE).hexdigest()
+    with open(tmp_path / sha[:2] / sha, 'rb') as f:
+        assert f.read() == IMAGE
+
+
+def test_same_bytes_different_extensions_stored_once(tmp_path):
+    index_file = str(tmp_path / 'index.json')
+
+    async def scenario(base):
+        urls = [f'{base}/a.jpg', f'{base}/a.webp', f'{base}/cover']
+        return await assets.download_assets(urls, index_file=index_file, bandwidth=None, rate=None,
+                                            root=str(tmp_path))
+
+    counts = asyncio.run(run_server({'/a.jpg': image, '/a.webp': image, '/cover': image}, scenario))
+    assert (counts['new'], counts['dup']) == (1, 2)
+    index = assets.load_index(index_file)
+    assert len({e['path'] for e in index.values()}) == 1
+    assert sorted(e['ext'] for e in index.values()) == ['.jpg', '.jpg', '.webp']
+    sha = hashlib.sha256(IMAGE).hexdigest()
+    assert os.listdir(tmp_path / sha[:2]) == [sha]
+
+
+def test_site_for_page():
+    assert assets.site_for_page('https://movie.douban.com/top250?start=25') == 'douban'
+    assert assets.site_for_page('https://books.toscrape.com/catalogue/page-2.html') == 'books'
+    assert assets.site_for_page('https://example.com/') is None
+
+
+def test_unsolicited_304(tmp_path):
+    async def scenario(base):
+        return await assets.download_assets([f'{base}/x.jpg'], index_file=str(tmp_path / 'index.json'),
+                                             root=str(tmp_path))
+
+    counts = asyncio.run(run_server({'/x.jpg': always_304}, scenario))
+    assert (counts['unchanged'], counts['failed']) == (1, 0)
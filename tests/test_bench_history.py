@@ -0,0 +1,54 @@
+import sys
+
+import pytest
+
+import bench_history
+from bench_history import mann_whitney_u
+
+
+def test_exact_p_small_samples():
+    # 3 vs 3 完全分开时精确双侧p = 2/20
+    assert mann_whitney_u([1, 1.1, 1.2], [2, 2.1, 2.2]) == (0.0, 0.1)
+    _, p = mann_whitney_u([1, 1.1, 1.2, 1.3], [2, 2.1, 2.2, 2.3])
+    assert abs(p - 2 / 70) < 1e-12
+    _, p = mann_whitney_u([1, 2, 3, 4, 5], [1.5, 2.5, 3.5, 4.5, 5.5])
+    assert abs(p - 0.6905) < 1e-4
+
+
+def test_compare_flags_regression_with_min_samples(tmp_path):
+    db = str(tmp_path / 'bench.sqlite')
+    conn = bench_history.connect(db)
+    for commit, samples in [('base', [1.0, 1.1, 1.05, 0.95]), ('cand', [2.0, 2.1, 1.9, 2.2])]:
+        for v in samples:
+            conn.execute("INSERT INTO runs (ts, kind, engine, git_commit, samples) "
+                         "VALUES (0, 'crawl', 'books_aiohttp', ?, ?)", (commit, f'[{v}]'))
+    conn.commit()
+    rows = bench_history.compare(conn, 'base', 'cand')
+    assert [r['status'] for r in rows] == ['regression']
+
+
+def test_compare_matches_commit_prefixes(tmp_path, monkeypatch):
+    db = str(tmp_path / 'bench.sqlite')
+    conn = bench_history.connect(db)
+    for commit in ('abc1234', 'def5678'):
+        for v in (1.0, 1.1, 1.05, 0.95):
+            conn.execute("INSERT INTO runs (ts, kind, engine, git_commit, samples) "
+                         "VALUES (0, 'crawl', 'books_aiohttp', ?, ?)", (commit, f'[{v}]'))
+    conn.execute("INSERT INTO runs (ts, kind, engine, git_commit, samples) "
+                 "VALUES (0, 'crawl', 'books_regex', 'fff0000', '[1.0]')")
+    conn.commit()
+
+    full = 'abc1234' + 'e' * 33
+    assert [r['status'] for r in bench_history.compare(conn, full, 'def5678')] == ['same']
+    assert [r['status'] for r in bench_history.compare(conn, 'abc1', 'def56789')] == ['same']
+    with pytest.raises(ValueError):
+        bench_history.compare(conn, '0123456', 'def5678')
+    conn.close()
+
+    # 找不到commit / 没有共同项都不能算通过
+    for baseline in ('0123456', 'fff0000'):
+        monkeypatch.setattr(sys, 'argv', ['bench_history.py', '--db', db, 'compare',
+                                          '--baseline', baseline, '--candidate', 'abc1234'])
+        with pytest.raises(SystemExit) as exc:
+            bench_history.main()
+        assert exc.value.code == 2
@@ -0,0 +1,63 @@
+import time
+
+from frontier import SITES, SQLiteWorkQueue
+
+
+def expire_leases(queue):
+    queue.conn.execute("UPDATE frontier SET lease_expires = 0 WHERE state = 'leased'")
+
+
+def test_expired_lease_fails_after_max_attempts(tmp_path):
+    queue = SQLiteWorkQueue(str(tmp_path / 'frontier.sqlite'), host_delay={'example.com': 0},
+                            max_attempts=3)
+    url = 'https://example.com/page-1.html'
+    queue.push([url], 'books')
+
+    for attempt in range(1, 4):
+        claimed = queue.claim(f'w{attempt}', batch_size=1)
+        assert [c[0] for c in claimed] == [url]
+        expire_leases(queue)
+
+    # 第3次租约过期后不再回队列
+    assert queue.claim('w4', batch_size=1) == []
+    state, attempts, error = queue.conn.execute(
+        'SELECT state, attempts, error FROM frontier WHERE url = ?', (url,)).fetchone()
+    assert (state, attempts, error) == ('failed', 3, 'lease expired')
+    queue.close()
+
+
+def test_expired_lease_returns_to_pending(tmp_path):
+    queue = SQLiteWorkQueue(str(tmp_path / 'frontier.sqlite'), host_delay={'example.com': 0},
+                            max_attempts=3)
+    url = 'https://example.com/page-1.html'
+    queue.push([url], 'books')
+    queue.claim('w1', batch_size=1)
+    expire_leases(queue)
+
+    claimed = queue.claim('w2', batch_size=1)
+    assert [c[0] for c in claimed] == [url]
+    assert queue.complete(url, 'w2', [{'title': 'x'}])
+    assert not queue.complete(url, 'w1', [])
+    queue.close()
+
+
+def test_claim_spreads_hosts_across_workers(tmp_path):
+    queue = SQLiteWorkQueue(str(tmp_path / 'frontier.sqlite'), host_batch=3)
+    queue.push(SITES['douban'][1], 'douban')
+    queue.push(SITES['books'][1], 'books')
+
+    now = time.time()
+    a = queue.claim('A', batch_size=5)
+    b = queue.claim('B', batch_size=5)
+    for batch in (a, b):
+        sites = [site for _, site, _ in batch]
+        assert len(batch) == 5
+        assert set(sites) == {'douban', 'books'}
+        assert max(sites.count('douban'), sites.count('books')) <= 3
+        # 按请求时间排好, worker不会卡在一个host上等
+        slots = [slot for _, _, slot in batch]
+        assert slots == sorted(slots)
+    # 第二个worker不用先等前一批的豆瓣间隔排完
+    assert b[0][2] - now < 1.0
+    assert not {url for url, _, _ in a} & {url for url, _, _ in b}
+    queue.close()
@@ -0,0 +1,80 @@
+import requests
+
+import render_router
+from bench_parsers import make_books_page
+
+
+class FakeResponse(object):
+
+    def __init__(self, status, content=b''):
+        self.status_code = status
+        self.content = content
+        self.headers = {'Content-Type': 'text/html; charset=utf-8'}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'{self.status_code} Error')
+
+
+class FakeSession(object):
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def get(self, url, timeout=None):
+        page = self.pages[url]
+        if isinstance(page, Exception):
+            raise page
+        return page
+
+
+def test_crawl_static_skips_failed_pages():
+    base = 'https://books.toscrape.com/catalogue/page-{}.html'
+    content, expected = make_books_page(20)
+    good = FakeResponse(200, content)
+    session = FakeSession({
+        base.format(1): good,
+        base.format(2): FakeResponse(503),
+        base.format(3): requests.ConnectionError('reset'),
+        base.format(4): good,
+    })
+    records = render_router.crawl_static('books', [base.format(i) for i in range(1, 5)], 'regex', session)
+    assert len(records) == 2 * len(expected)
+
+
+def test_save_cache_roundtrip(tmp_path):
+    path = str(tmp_path / 'tiers.json')
+    render_router.save_cache({'books': {'tier': 'browser', 'reason': 'HTTP 403', 'probed': 0}}, path)
+    assert render_router.probe_reason('books', path) == 'HTTP 403'
+    assert render_router.probe_reason('other', path) is None
+
+
+def test_failed_fetch_cached_briefly(tmp_path, monkeypatch):
+    path = str(tmp_path / 'tiers.json')
+    probes = []
+
+    def fake_probe(site, session=None):
+        probes.append(site)
+        return {'probed': render_router.time.time(), 'tier': 'browser', 'tiers': {},
+                'reason': 'fetch failed: timeout', 'fetch_failed': True}
+
+    monkeypatch.setattr(render_router, 'probe', fake_probe)
+    url = render_router.ROUTES['books']['sample']
+    assert render_router.route(url, cache_file=path) == 'browser'
+    assert render_router.route(url, cache_file=path) == 'browser'
+    assert len(probes) == 1
+
+    cache = render_router.load_cache(path)
+    cache['books']['probed'] -= render_router.RETRY_TTL + 1
+    render_router.save_cache(cache, path)
+    render_router.route(url, cache_file=path)
+    assert len(probes) == 2
+
+    # 抓到了但静态档位都不行的browser结果按正常TTL缓存
+    cache = render_router.load_cache(path)
+    cache['books'].pop('fetch_failed')
+    cache['books']['probed'] -= render_router.RETRY_TTL + 1
+    render_router.save_cache(cache, path)
+    render_router.route(url, cache_file=path)
+    assert len(probes) == 2
+    assert render_router.route('https://example.com/', cache_file=path) == 'browser'
@@ -0,0 +1,80 @@
+import csv
+import json
+
+import search_index
+from search_index import SearchIndex
+
+FIELDS = ['rank', 'title', 'director', 'year', 'rating', 'url']
+
+
+def movie(i, title, director, year, rating):
+    return {'rank': str(i), 'title': title, 'director': director, 'year': str(year),
+            'rating': str(rating), 'url': f'https://movie.douban.com/subject/{i}/'}
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        w = csv.DictWriter(f, fieldnames=FIELDS)
+        w.writeheader()
+        w.writerows(rows)
+
+
+def test_build_replaces_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(search_index, 'INDEX_DIR', str(tmp_path / 'index'))
+    path = str(tmp_path / 'douban_movies.csv')
+    write_csv(path, [movie(1, '千与千寻', '宫崎骏', 2001, 9.4), movie(2, '龙猫', '宫崎骏', 1988, 9.2)])
+    for _ in range(3):
+        search_index.build_from_csv(path)
+    write_csv(path, [movie(1, '千与千寻', '宫崎骏', 2001, 9.4)])
+    search_index.build_from_csv(path)
+
+    with open(search_index.index_path('douban_movies'), encoding='utf-8') as f:
+        data = json.load(f)
+    assert len(data['docs']) == 1 and None not in data['docs']
+    idx = search_index.open_index('douban_movies')
+    assert [r['title'] for r in idx.query('director:宫崎骏')] == ['千与千寻']
+
+
+def test_update_reuses_doc_id_and_save_compacts(tmp_path):
+    idx = SearchIndex(FIELDS)
+    idx.add(movie(1, '肖申克的救赎', '弗兰克·德拉邦特', 1994, 9.7))
+    idx.add(movie(2, '千与千寻', '宫崎骏', 2001, 9.4))
+    idx.add(movie(3, '龙猫', '宫崎骏', 1988, 9.2))
+    assert idx.add(movie(3, '龙猫', '宫崎骏', 1988, 8.0)) == 2
+    assert len(idx.docs) == 3
+    assert [r['title'] for r in idx.query('rating>=9')] == ['肖申克的救赎', '千与千寻']
+
+    idx.remove(movie(1, '', '', 0, 0)['url'])
+    path = str(tmp_path / 'idx.json')
+    idx.save(path)
+    loaded = SearchIndex.load(path)
+    assert len(loaded.docs) == 2
+    assert [r['title'] for r in loaded.query('宫崎骏 rating<9')] == ['龙猫']
+    assert [r['title'] for r in loaded.query('year>2000')] == ['千与千寻']
+
+
+def test_extend_matches_add():
+    rows = [movie(i, f'电影{i}', f'导演{i % 7}', 1950 + (i * 37) % 70, round(7 + (i * 13) % 30 / 10, 1))
+            for i in range(200)]
+    rows.append(movie(5, '改名了', '导演X', 2020, 8.0))
+    one = SearchIndex(FIELDS)
+    for r in rows:
+        one.add(r)
+    bulk = SearchIndex(FIELDS)
+    bulk.extend(rows[:100])
+    bulk.extend(rows[100:])
+    assert bulk.to_dict() == one.to_dict()
+    assert bulk.query('rating>=9.5') == one.query('rating>=9.5')
+
+
+def test_open_index_builds_from_csv(tmp_path, monkeypatch):
+    monkeypatch.setattr(search_index, 'INDEX_DIR', str(tmp_path / 'index'))
+    path = str(tmp_path / 'douban_movies.csv')
+    write_csv(path, [movie(1, '千与千寻', '宫崎骏', 2001, 9.4)])
+    idx = search_index.open_index('douban_movies', path)
+    assert [r['title'] for r in idx.query('director:宫崎骏')] == ['千与千寻']
+    idx.add(movie(2, '龙猫', '宫崎骏', 1988, 9.2))
+    idx.save(search_index.index_path('douban_movies'))
+    # 已经有索引就直接加载, 不会被csv覆盖
+    assert len(search_index.open_index('douban_movies', path).query('director:宫崎骏')) == 2
+    assert search_index.open_index('books_requests', str(tmp_path / 'missing.csv')).docs == []
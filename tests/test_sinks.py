@@ -0,0 +1,100 @@
+import csv
+import json
+import os
+
+import pytest
+
+from sinks import (CODEC_EXT, PartitionedSink, atomic_write_csv, new_partitions, open_partition,
+                   read_manifest)
+
+
+def test_atomic_write_csv_replaces_file(tmp_path):
+    path = str(tmp_path / 'books.csv')
+    atomic_write_csv([{'title': '旧', 'price': '1'}], path, ['title', 'price'])
+    atomic_write_csv([{'title': '新', 'price': '2'}], path, ['title', 'price'])
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        assert list(csv.DictReader(f)) == [{'title': '新', 'price': '2'}]
+    assert os.listdir(tmp_path) == ['books.csv']
+
+
+def test_atomic_write_csv_keeps_old_file_on_error(tmp_path):
+    path = str(tmp_path / 'books.csv')
+    atomic_write_csv([{'title': '旧'}], path, ['title'])
+    with pytest.raises(ValueError):
+        atomic_write_csv([{'title': '新', 'extra': 1}], path, ['title'])
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        assert list(csv.DictReader(f)) == [{'title': '旧'}]
+    # 临时文件已删掉
+    assert os.listdir(tmp_path) == ['books.csv']
+
+
+def read_rows(entries):
+    rows = []
+    for entry in entries:
+        with open_partition(entry['abspath']) as f:
+            rows.extend(csv.DictReader(f))
+    return rows
+
+
+def books(n):
+    return [{'title': f'book{i}', 'price': str(i)} for i in range(n)]
+
+
+@pytest.mark.parametrize('codec', ['gzip', 'none'])
+def test_partitioned_rollover_and_manifest(tmp_path, codec):
+    with PartitionedSink('books', ['title', 'price'], root=str(tmp_path), codec=codec, max_rows=2,
+                         run_id='r1', date='2026-10-01') as sink:
+        sink.write_many(books(5))
+    manifest = read_manifest(str(tmp_path / 'books'))
+    assert [p['rows'] for p in manifest['partitions']] == [2, 2, 1]
+    assert [p['path'] for p in manifest['partitions']] == [
+        f'date=2026-10-01/run=r1/part-{i:05d}{CODEC_EXT[codec]}' for i in range(3)]
+    assert manifest['runs']['r1']['status'] == 'complete'
+    parts = new_partitions('books', root=str(tmp_path))
+    assert read_rows(parts) == books(5)
+    # 没有残留的临时文件
+    assert sorted(os.listdir(tmp_path / 'books' / 'date=2026-10-01' / 'run=r1')) == [
+        os.path.basename(p['path']) for p in manifest['partitions']]
+
+
+def test_abort_publishes_nothing(tmp_path):
+    with pytest.raises(RuntimeError):
+        with PartitionedSink('books', ['title', 'price'], root=str(tmp_path), run_id='r1') as sink:
+            sink.write_many(books(3))
+            raise RuntimeError('crawl failed')
+    assert new_partitions('books', root=str(tmp_path), incomplete=True) == []
+    assert os.listdir(sink.run_dir) == []
+
+
+def test_partial_run_hidden_until_complete(tmp_path):
+    root = str(tmp_path)
+    with PartitionedSink('books', ['title', 'price'], root=root, max_rows=2, run_id='ok',
+                         date='2026-09-30') as sink:
+        sink.write_many(books(2))
+
+    sink = PartitionedSink('books', ['title', 'price'], root=root, max_rows=2, run_id='half',
+                           date='2026-10-01')
+    sink.write_many(books(3))
+    # 第一个分块已经发布, 但run还没close
+    assert [p['run'] for p in new_partitions('books', root=root)] == ['ok']
+    assert len(new_partitions('books', root=root, incomplete=True)) == 2
+    sink.abort()
+    assert read_manifest(str(tmp_path / 'books'))['runs']['half']['status'] == 'aborted'
+    assert [p['run'] for p in new_partitions('books', root=root)] == ['ok']
+
+    with PartitionedSink('books', ['title', 'price'], root=root, max_rows=2, run_id='new',
+                         date='2026-10-02') as sink:
+        sink.write_many(books(3))
+    seen = {p['path'] for p in new_partitions('books', root=root)}
+    assert [p['run'] for p in new_partitions('books', root=root, since='2026-10-01')] == ['new', 'new']
+    assert new_partitions('books', root=root, seen=seen) == []
+
+
+def test_manifest_without_run_status_is_readable(tmp_path):
+    with PartitionedSink('books', ['title', 'price'], root=str(tmp_path), run_id='old') as sink:
+        sink.write_many(books(1))
+    path = tmp_path / 'books' / 'manifest.json'
+    manifest = json.loads(path.read_text(encoding='utf-8'))
+    del manifest['runs']
+    path.write_text(json.dumps(manifest), encoding='utf-8')
+    assert read_rows(new_partitions('books', root=str(tmp_path))) == books(1)
@@ -0,0 +1,59 @@
+import math
+import os
+
+import pytest
+
+import snapshot
+from snapshot import Snapshot, write_snapshot
+
+FIELDS = ['rank', 'title', 'rating', 'votes', 'url']
+RECORDS = [
+    {'rank': '1', 'title': '肖申克的救赎', 'rating': '9.7', 'votes': '3,012,345', 'url': 'https://a/1'},
+    {'rank': '', 'title': '', 'rating': 'n/a', 'votes': None, 'url': 'https://a/2'},
+    {'rank': 'inf', 'title': 'Léon', 'rating': '8.9', 'votes': '-', 'url': 'https://a/3'},
+    {'rank': '99999999999', 'title': 'x' * 1000, 'rating': None, 'votes': '1e30', 'url': ''},
+]
+
+
+@pytest.fixture(params=[True, False], ids=['numpy', 'memoryview'])
+def numpy_mode(request, monkeypatch):
+    monkeypatch.setattr(snapshot, 'HAS_NUMPY', request.param)
+    return request.param
+
+
+def test_roundtrip(tmp_path, numpy_mode):
+    path = str(tmp_path / 'movies.snap')
+    write_snapshot(RECORDS, path, FIELDS)
+    assert os.listdir(tmp_path) == ['movies.snap']
+    with Snapshot(path) as snap:
+        assert len(snap) == 4 and snap.fields == FIELDS
+        # 缺失 / 转不了 / 超出范围的整数是-1, 浮点是NaN
+        assert list(snap.column('rank')) == [1, -1, -1, -1]
+        assert list(snap.column('votes')) == [3012345, -1, -1, -1]
+        rating = list(snap.column('rating'))
+        assert rating[0] == 9.7 and rating[2] == 8.9
+        assert math.isnan(rating[1]) and math.isnan(rating[3])
+        assert snap.strings('title') == ['肖申克的救赎', '', 'Léon', 'x' * 1000]
+        assert snap.string('url', 2) == 'https://a/3'
+        row = snap.row(0)
+        assert row == {'rank': 1, 'title': '肖申克的救赎', 'rating': 9.7, 'votes': 3012345, 'url': 'https://a/1'}
+        del rating, row
+
+
+def test_empty(tmp_path, numpy_mode):
+    path = str(tmp_path / 'empty.snap')
+    write_snapshot([], path, FIELDS)
+    with Snapshot(path) as snap:
+        assert len(snap) == 0
+        assert list(snap.column('rating')) == []
+        assert snap.strings('title') == []
+
+
+def test_column_type_errors(tmp_path):
+    path = str(tmp_path / 'movies.snap')
+    write_snapshot(RECORDS, path, FIELDS)
+    with Snapshot(path) as snap:
+        with pytest.raises(TypeError):
+            snap.column('title')
+        with pytest.raises(TypeError):
+            snap.strings('rank')
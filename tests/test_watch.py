@@ -0,0 +1,57 @@
+from frontier import SITES
+from watch import Watcher
+
+PAGES = SITES['douban'][1]
+A, B = PAGES[0], PAGES[1]
+
+
+def rec(key, rank):
+    return {'url': key, 'title': key, 'rank': str(rank)}
+
+
+def make_watcher(tmp_path):
+    w = Watcher(['douban'], state_file=str(tmp_path / 'state.json'))
+    w.apply(A, [rec('a', 1), rec('x', 25)])
+    w.apply(B, [rec('b', 26)])
+    for url in PAGES[2:]:
+        w.apply(url, [])
+    return w
+
+
+def ops(events):
+    return [(ev['op'], ev['key']) for ev in events]
+
+
+def test_move_source_page_polled_first(tmp_path):
+    w = make_watcher(tmp_path)
+    assert ops(w.apply(A, [rec('a', 1)])) == []
+    assert ops(w.apply(B, [rec('x', 24), rec('b', 26)])) == [('updated', 'x')]
+    for url in PAGES[2:]:
+        assert w.apply(url, []) == []
+    assert w.apply(A, [rec('a', 1)]) == []
+    assert w.records['douban']['x']['page'] == B
+
+
+def test_move_target_page_polled_first(tmp_path):
+    w = make_watcher(tmp_path)
+    assert w.apply(B, [rec('x', 25), rec('b', 26)]) == []
+    assert ops(w.apply(A, [rec('a', 1)])) == []
+    assert w.records['douban']['x']['page'] == B
+
+
+def test_not_modified_page_still_holds_record(tmp_path):
+    w = make_watcher(tmp_path)
+    w.apply(A, [rec('a', 1)])
+    # B上次就有x(同一条记录在两页都出现过), 304时按B上次的keys算
+    w.pages[B]['keys'].append('x')
+    assert w.apply(B, None) == []
+    assert 'missing' not in w.records['douban']['x']
+
+
+def test_removed_after_every_page_checked(tmp_path):
+    w = make_watcher(tmp_path)
+    assert w.apply(A, [rec('a', 1)]) == []
+    for url in PAGES[1:-1]:
+        assert w.apply(url, None if url == B else []) == []
+    assert ops(w.apply(PAGES[-1], [])) == [('removed', 'x')]
+    assert 'x' not in w.records['douban']